@@ -0,0 +1,62 @@
+"""
+End-to-end benchmark against the local mock server.
+
+Runs the same steps as main() (login, company lookup, searching, writing
+the files) against benchmarks/mock_server.py, so a whole run can be timed
+on a machine with no network. Prints the per-stage timings recorded by
+linkedin.RunMetrics.
+
+Usage: python benchmarks/bench_e2e.py [size] [extra linkedin.py arguments ...]
+       e.g. python benchmarks/bench_e2e.py 20000 --geoblast --stream
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from mock_server import start_server  # noqa: E402
+
+
+def print_report(report):
+    for name, stage in report['stages'].items():
+        print(f"  {name:<14} {stage['count']:6d} x {stage['mean'] * 1000:9.3f} ms"
+              f" = {stage['total']:8.3f} s")
+    for name, call in report['http'].items():
+        print(f"  HTTP {name:<28} {call['count']:6d} x p50 {call['p50'] * 1000:7.3f} ms"
+              f" p95 {call['p95'] * 1000:7.3f} ms")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    extra = sys.argv[2:]
+
+    server = start_server(size)
+    linkedin.BASE_URL = server.base_url
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        args = linkedin.parse_arguments(['crawl', '-u', 'bench@example.com', '-p', 'bench',
+                                         '-c', 'mock-company', '-o', out_dir, *extra])
+
+        # The per-page progress output would swamp the timings.
+        metrics = linkedin.RunMetrics()
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                linkedin.run(args, metrics)
+            finally:
+                sys.stdout = sys.__stdout__
+        total = time.perf_counter() - start
+        print_report(metrics.report())
+
+        lines = sum(1 for name in os.listdir(out_dir)
+                    for _ in open(os.path.join(out_dir, name), encoding='utf-8'))
+        print(f"{size} employees, {lines} output lines, {total:.3f} s total")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmarks --exclude: building, saving and loading a BloomFilter from a list
+of known usernames, and what it adds to writing the output files.
+
+Each requested size is the number of known usernames in the list. The
+employees written are a synthetic corpus (see corpus.py) of 100000 names,
+and a third of their distinct flast usernames are on the list.
+
+Usage: python benchmarks/bench_exclude.py [size ...]
+       (defaults to 100000 and 1000000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees  # noqa: E402
+
+EMPLOYEES = 100000
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"  {label:<36} {time.perf_counter() - start:8.2f} s")
+    return result
+
+
+def write_out(employees, out_dir, exclude):
+    formats = linkedin.load_formats(exclude=exclude)
+    linkedin.write_files('bench', '@example.com', employees, out_dir, formats)
+    with open(f'{out_dir}/bench-flast.txt', encoding='utf-8') as infile:
+        return sum(1 for _ in infile)
+
+
+def run(size, out_dir):
+    print(f"\n{size} known usernames")
+    employees = [linkedin.Employee(f'{first} {last}', occupation)
+                 for first, last, occupation in make_employees(EMPLOYEES)]
+    flast = sorted({username for employee in employees
+                    for username in linkedin.NameMutator(employee.full_name).f_last()})
+    known = flast[::3]
+
+    list_path = f'{out_dir}/known-{size}.txt'
+    with open(list_path, 'w', encoding='utf-8') as outfile:
+        outfile.writelines(f'{username}@example.com\n' for username in known)
+        outfile.writelines(f'user{index}@example.com\n' for index in range(size - len(known)))
+
+    bloom = timed('build from the list', linkedin.BloomFilter.from_list, list_path)
+    timed('save', bloom.save, list_path + '.bloom')
+    timed('load', linkedin.BloomFilter.load, list_path + '.bloom')
+    print(f"  {'filter size':<36} {len(bloom.bits) / 1024 / 1024:8.2f} MB")
+
+    written = timed('write_files', write_out, employees, out_dir, None)
+    kept = timed('write_files --exclude', write_out, employees, out_dir, [bloom])
+    print(f"  {'flast usernames kept':<36} {kept:8} of {written}")
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [100000, 1000000]
+    with tempfile.TemporaryDirectory() as out_dir:
+        for size in sizes:
+            run(size, out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmarks the --dedup and --sort finalization of the username files.
+
+Writes a first.last file for a synthetic corpus (see corpus.py) at each requested
+size, then finalizes copies of it fully in memory and with a small
+--max-memory that forces the external merge sort, printing the time and the
+peak traced memory of each.
+
+Usage: python benchmarks/bench_finalize.py [size ...]
+       (defaults to 100000 and 1000000)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees  # noqa: E402
+
+VARIANTS = [('in memory', False, 4096), ('in memory, sorted', True, 4096),
+            ('spilling at 16 MB', False, 16), ('spilling at 16 MB, sorted', True, 16)]
+
+
+def letters(number):
+    # Names are cleaned down to letters, so numbers are spelled with them.
+    text = ''
+    while True:
+        text += 'abcdefghijklmnopqrstuvwxyz'[number % 26]
+        number //= 26
+        if not number:
+            return text
+
+
+def run(size, out_dir):
+    print(f"\n{size} names")
+    # Lettered surnames, so there are plenty of distinct usernames as well as repeats.
+    employees = [linkedin.Employee(f'{first} {last}{letters(index % (size // 4 + 1))}',
+                                   occupation)
+                 for index, (first, last, occupation) in enumerate(make_employees(size))]
+    formats = {'first.last': linkedin.BUILTIN_FORMATS['first.last']}
+    linkedin.write_files('bench', '@example.com', employees, out_dir, formats)
+    source = f'{out_dir}/bench-first.last.txt'
+    del employees
+
+    for label, sort, max_memory in VARIANTS:
+        path = f'{out_dir}/copy.txt'
+        shutil.copy(source, path)
+        start = time.perf_counter()
+        read, written = linkedin.finalize_file(path, sort, max_memory)
+        seconds = time.perf_counter() - start
+
+        # Tracing slows everything down, so memory is measured on a second run.
+        shutil.copy(source, path)
+        tracemalloc.start()
+        linkedin.finalize_file(path, sort, max_memory)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {label:<28} {seconds:8.2f} s {peak / 1024 / 1024:8.1f} MB peak"
+              f" {written:9} of {read} unique")
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [100000, 1000000]
+    with tempfile.TemporaryDirectory() as out_dir:
+        for size in sizes:
+            run(size, out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory benchmark for holding employee records.
+
+Compares the old list of {'full_name', 'occupation'} dicts with a list of
+linkedin.Employee records (with their name parts filled in), at each
+requested size. Each variant is built in a fresh process, and both the
+Python allocations (tracemalloc) and the growth in resident memory are
+reported.
+
+Strings are copied for every record, the way they would be when parsed
+out of separate JSON pages, so nothing is shared by accident.
+
+Usage: python benchmarks/bench_memory.py [size ...]   (defaults to 100000 and 1000000)
+"""
+import gc
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees  # noqa: E402
+
+VARIANTS = ('dicts', 'records')
+
+
+def rss_kb():
+    """Current resident memory where /proc has it, otherwise the peak."""
+    try:
+        with open('/proc/self/statm') as infile:
+            return int(infile.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        # ru_maxrss is in KB on Linux but bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def fresh(text):
+    return text.encode('utf-8').decode('utf-8')
+
+
+def build(variant, rows):
+    if variant == 'dicts':
+        return [{'full_name': f'{first} {last}', 'occupation': fresh(occupation)}
+                for first, last, occupation in rows]
+
+    employees = [linkedin.Employee(f'{first} {last}', fresh(occupation))
+                 for first, last, occupation in rows]
+    # do_loops splits a page at a time, so do the same here.
+    for start in range(0, len(employees), 25):
+        linkedin.split_employees(employees[start:start + 25])
+    return employees
+
+
+def child(variant, size, measure):
+    """Builds one variant and prints its tracemalloc bytes or RSS growth in bytes."""
+    rows = make_employees(size)
+    gc.collect()
+
+    # tracemalloc has a large memory overhead of its own, so the two
+    # measurements are taken in separate runs.
+    if measure == 'traced':
+        tracemalloc.start()
+        records = build(variant, rows)
+        print(tracemalloc.get_traced_memory()[0])
+    else:
+        rss_before = rss_kb()
+        records = build(variant, rows)
+        gc.collect()
+        print((rss_kb() - rss_before) * 1024)
+    assert len(records) == size
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return
+
+    sizes = [int(size) for size in sys.argv[1:]] or [100000, 1000000]
+    for size in sizes:
+        print(f"\n{size} employees")
+        for variant in VARIANTS:
+            traced, rss = (measure_child(variant, size, measure) for measure in ('traced', 'rss'))
+            print(f"  {variant:<8} {traced / 2 ** 20:8.1f} MB allocated"
+                  f" {rss / 2 ** 20:8.1f} MB resident"
+                  f" {traced / size:6.0f} bytes/employee")
+
+
+def measure_child(variant, size, measure):
+    output = subprocess.run([sys.executable, __file__, '--child', variant, str(size), measure],
+                            capture_output=True, text=True, check=True).stdout
+    return int(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmarks the mutate command on big name lists: reading in batches on one
+process against the memory-mapped chunks spread over a process pool.
+
+Writes a raw-names file of a synthetic corpus (see corpus.py) at each
+requested size, then mutates it with each worker count, checking that every
+run writes the same files.
+
+Usage: python benchmarks/bench_mutate.py [size ...]
+       (defaults to 1000000 and 5000000, with 1 worker and every CPU)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees  # noqa: E402
+
+
+def read_outputs(out_dir):
+    outputs = {}
+    for format_name in linkedin.BUILTIN_FORMATS:
+        with open(f'{out_dir}/bench-{format_name}.txt', 'rb') as infile:
+            outputs[format_name] = infile.read()
+    return outputs
+
+
+def run(size, work_dir, worker_counts):
+    print(f"\n{size} names")
+    names_path = f'{work_dir}/names-{size}.txt'
+    with open(names_path, 'w', encoding='utf-8') as outfile:
+        outfile.writelines(f'{first} {last}\n' for first, last, _ in make_employees(size))
+    print(f"  {'list size':<24} {os.path.getsize(names_path) / 1024 / 1024:8.1f} MB")
+
+    expected = None
+    for workers in worker_counts:
+        out_dir = f'{work_dir}/out-{workers}'
+        start = time.perf_counter()
+        linkedin.mutate_name_files([names_path], 'bench', '@example.com', out_dir,
+                                   workers=workers)
+        seconds = time.perf_counter() - start
+        print(f"  {f'{workers} workers':<24} {seconds:8.2f} s"
+              f" {size / seconds:12.0f} names/s")
+
+        outputs = read_outputs(out_dir)
+        assert expected is None or outputs == expected, f'{workers} workers wrote different files'
+        expected = outputs
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1000000, 5000000]
+    worker_counts = sorted({1, os.cpu_count() or 1})
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            run(size, work_dir, worker_counts)
+
+
+if __name__ == '__main__':
+    main()
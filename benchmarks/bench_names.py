@@ -0,0 +1,86 @@
+"""
+Benchmarks the name cleaning, splitting, mutation and output stages.
+
+Runs every stage over a synthetic corpus (see corpus.py) at each requested
+size and prints the total time and the cost per name.
+
+Usage: python benchmarks/bench_names.py [size ...]
+       (defaults to 1000 and 100000; add 1000000 for the large run)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees  # noqa: E402
+
+MUTATOR_METHODS = ['f_last', 'f_dot_last', 'first_l', 'first_dot_last', 'first', 'last_f']
+
+
+def timed(label, count, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    print(f"  {label:<28} {seconds:9.3f} s {seconds / count * 1e9:10.0f} ns/name")
+    return result
+
+
+def clean_each(names):
+    return [linkedin.NameMutator.clean_name(name) for name in names]
+
+
+def split_each(names):
+    return [linkedin.NameMutator.split_name(name) for name in names]
+
+
+def call_method(mutators, method):
+    for mutator in mutators:
+        getattr(mutator, method)()
+
+
+def call_template(columns, template):
+    for first, last, middles, surnames in zip(*columns):
+        template(first, last, middles, surnames)
+
+
+def write_out(employees):
+    with tempfile.TemporaryDirectory() as out_dir:
+        linkedin.write_files('bench', '@example.com', employees, out_dir)
+
+
+def run(size):
+    print(f"\n{size} names")
+    employees = [linkedin.Employee(f'{first} {last}', occupation)
+                 for first, last, occupation in make_employees(size)]
+    names = [employee.full_name for employee in employees]
+
+    linkedin.CLEAN_CACHE.clear()
+    cleaned = timed('clean_name', size, clean_each, names)
+    timed('clean_name (cached)', size, clean_each, names)
+    linkedin.CLEAN_CACHE.clear()
+    timed('clean_names (batch)', size, linkedin.NameMutator.clean_names, names)
+    timed('clean_names (batch, cached)', size, linkedin.NameMutator.clean_names, names)
+    split = timed('split_name', size, split_each, cleaned)
+    columns = timed('split_names (batch)', size, linkedin.NameMutator.split_names, cleaned)
+
+    mutators = [linkedin.NameMutator.from_parts(name['first'], name['last'], name['middles'],
+                                                name['surnames'])
+                for name in split]
+    for method in MUTATOR_METHODS:
+        timed(f'NameMutator.{method}', size, call_method, mutators, method)
+    for format_name, template in linkedin.BUILTIN_FORMATS.items():
+        timed(f'template {format_name}', size, call_template, columns, template)
+
+    timed('write_files', size, write_out, employees)
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 100000]
+    for size in sizes:
+        run(size)
+
+
+if __name__ == '__main__':
+    main()
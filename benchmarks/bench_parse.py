@@ -0,0 +1,58 @@
+"""
+Micro-benchmark for parsing search result pages.
+
+Builds realistic 25-hit /voyager/api/search/hits pages and times how long it
+takes to get from the raw HTTP body to the list of employees, both the old
+way (decode to text, then parse) and through find_employees on the raw
+bytes, with each JSON backend that is installed.
+
+Usage: python benchmarks/bench_parse.py [pages]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees, make_page  # noqa: E402
+
+def old_parse(content):
+    """The previous path: decode to text, parse with json, keep two fields."""
+    result_json = json.loads(content.decode('utf-8'))
+    found = []
+    for body in result_json['elements']:
+        profile = body['hitInfo']['com.linkedin.voyager.search.SearchProfile']['miniProfile']
+        found.append({'full_name': f"{profile['firstName']} {profile['lastName']}",
+                      'occupation': profile['occupation']})
+    return found
+
+
+def run(func, pages):
+    for page in pages:
+        func(page)
+
+
+def main():
+    pages_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    employees = make_employees(pages_count * 25)
+    pages = [make_page(employees, i * 25, total=1000) for i in range(pages_count)]
+    size = sum(len(page) for page in pages) / len(pages)
+    print(f"{pages_count} pages of 25 hits, {size / 1024:.1f} KB per page on average")
+
+    cases = [('decode + json (old)', old_parse),
+             (f'find_employees ({linkedin.json_loads.__module__})', linkedin.find_employees)]
+    try:
+        import orjson
+        cases.append(('orjson.loads only', orjson.loads))
+    except ImportError:
+        print("orjson is not installed, skipping it")
+    cases.append(('json.loads only', json.loads))
+
+    for label, func in cases:
+        seconds = min(timeit.repeat(lambda: run(func, pages), number=3, repeat=7)) / 3
+        print(f"{label:<32} {seconds / pages_count * 1e6:8.1f} us/page")
+
+
+if __name__ == '__main__':
+    main()
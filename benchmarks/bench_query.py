@@ -0,0 +1,78 @@
+"""
+Benchmarks role-targeted queries: the EmployeeStore occupation index
+against a linear scan of the meta-data file.
+
+Fills a store and a meta-data file with the same synthetic corpus (see
+corpus.py) at each requested size, then times a few occupation queries
+both ways. Each name gets a numeric suffix so the store keeps everyone.
+
+Usage: python benchmarks/bench_query.py [size ...]
+       (defaults to 10000 and 100000)
+"""
+import csv
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees  # noqa: E402
+
+QUERIES = [['helpdesk'], ['finance*', 'financial'], ['information technology', 'it'],
+           ['recruiter']]
+REPEATS = 20
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = func(*args)
+    seconds = (time.perf_counter() - start) / REPEATS
+    print(f"  {label:<44} {seconds * 1000:9.2f} ms {len(result):8} matches")
+    return result
+
+
+def scan(path, terms):
+    # What grepping the meta-data file amounts to, with the same matching rules.
+    patterns = [r'\b' + re.escape(term.rstrip('*')) + ('' if term.endswith('*') else r'\b')
+                for term in terms]
+    regex = re.compile('|'.join(patterns), re.IGNORECASE)
+    with open(path, encoding='utf-8', newline='') as infile:
+        reader = csv.reader(infile)
+        next(reader)
+        return [row for row in reader if regex.search(row[1])]
+
+
+def run(size, out_dir):
+    print(f"\n{size} employees")
+    employees = [linkedin.Employee(f'{first} {last} {index}', occupation)
+                 for index, (first, last, occupation) in enumerate(make_employees(size))]
+
+    db_path = f'{out_dir}/bench-{size}.db'
+    start = time.perf_counter()
+    with linkedin.EmployeeStore(db_path) as store:
+        store.start_run('1', 'bench', linkedin.BUILTIN_FORMATS)
+        store.write(employees)
+    print(f"  {'filling the store':<44} {time.perf_counter() - start:9.2f} s")
+    linkedin.write_files(f'bench-{size}', '@example.com', employees, out_dir)
+    meta_path = f'{out_dir}/bench-{size}-meta-data.txt'
+
+    with linkedin.EmployeeStore(db_path) as store:
+        for terms in QUERIES:
+            label = ' OR '.join(terms)
+            indexed = timed(f'index: {label}', store.query, '1', terms)
+            scanned = timed(f'scan:  {label}', scan, meta_path, terms)
+            assert len(indexed) == len(scanned)
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000]
+    with tempfile.TemporaryDirectory() as out_dir:
+        for size in sizes:
+            run(size, out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Synthetic employee corpora for the benchmarks.
+
+Names are built to look like what LinkedIn searches return: accented
+letters, titles, credentials in parentheses, hyphenated and multi-part
+surnames, and the odd middle name. Everything is seeded, so a given size
+always produces the same corpus.
+"""
+import json
+import random
+
+FIRST_NAMES = [
+    'Rahul', 'Priya', 'John', 'Mary', 'Mary-Jane', 'José', 'Zoë', 'François', 'Jürgen',
+    'Anna', 'Wei', 'Fatima', 'Olumide', 'Siobhán', 'Renée', 'Björn', 'Ñuño', 'Chloé',
+    'Michael', 'Sarah', 'David', 'Emily', 'Ahmed', 'Yuki', 'Raphaël', 'Inês', 'Kai']
+MIDDLE_NAMES = ['Ann', 'Lee', 'Marie', 'James', 'Kumar', 'Elizabeth', 'José', 'Luis']
+LAST_NAMES = [
+    'Sharma', 'Smith', 'Álvarez', 'García-López', 'Weiß', "O'Brien", 'Nguyen', 'Khan',
+    'de la Cruz', 'van der Berg', 'Smith-Jones', 'Müller', 'Dubois', 'Øster', 'Ferreira',
+    'Kowalski', 'Papadopoulos', 'Johnson', 'Williams', 'Brown', 'Okafor', 'Tanaka']
+TITLES = ['Dr.', 'Mr', 'Mrs.', 'Prof.', 'Miss']
+CREDENTIALS = [', MBA', ' (PhD)', ' (CISSP, CISM)', ' PMP', ', MD', ' (she/her)', ' 🚀']
+OCCUPATIONS = [
+    'Software Engineer', 'Senior Software Engineer', 'IT Helpdesk Analyst',
+    'Finance Director', 'Head of Sales', 'Human Resources Business Partner',
+    'Information Technology Manager', 'Accounts Payable Officer', 'Security Guard',
+    'Customer Service Representative', 'Chief Financial Officer', 'Recruiter']
+
+
+def make_employees(count, seed=1):
+    """Returns count employees as (first name, last name, occupation) tuples."""
+    rng = random.Random(seed)
+    employees = []
+    for _ in range(count):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        roll = rng.random()
+        if roll < 0.10:
+            first = rng.choice(TITLES) + ' ' + first
+        elif roll < 0.20:
+            first = first + ' ' + rng.choice(MIDDLE_NAMES)
+        if rng.random() < 0.15:
+            last = last + rng.choice(CREDENTIALS)
+        employees.append((first, last, rng.choice(OCCUPATIONS)))
+    return employees
+
+
+def make_names(count, seed=1):
+    """Returns count raw full names, as find_employees would build them."""
+    return [f'{first} {last}' for first, last, _ in make_employees(count, seed)]
+
+
+def make_hit(first, last, occupation, index):
+    """One search hit, with the extra fields a real miniProfile carries."""
+    public_id = f'member-{index}'
+    return {
+        'hitInfo': {'com.linkedin.voyager.search.SearchProfile': {
+            'id': f'ACoAA{index:010d}',
+            'distance': {'value': 'OUT_OF_NETWORK'},
+            'industry': 'Computer Software',
+            'location': 'Sydney, Australia',
+            'headless': False,
+            'sharedConnectionCount': index % 20,
+            'miniProfile': {
+                'firstName': first,
+                'lastName': last,
+                'occupation': occupation,
+                'objectUrn': f'urn:li:member:{index}',
+                'entityUrn': f'urn:li:fs_miniProfile:ACoAA{index:010d}',
+                'publicIdentifier': public_id,
+                'trackingId': 'x' * 24,
+                'picture': {'com.linkedin.common.VectorImage': {
+                    'rootUrl': 'https://media.licdn.com/dms/image/',
+                    'artifacts': [{'width': size, 'height': size,
+                                   'fileIdentifyingUrlPathSegment': f'{size}_{size}/{public_id}.jpg'}
+                                  for size in (100, 200, 400, 800)]}}}}},
+        'trackingId': 'y' * 24,
+        'targetPageInstance': 'urn:li:page:d_flagship3_search_srp_people',
+    }
+
+
+def make_page(employees, start, total=None, count=25, reachable=None):
+    """
+    The raw body of one /voyager/api/search/hits page of employees.
+
+    total is how many results the search has, and reachable how many of them
+    can be paged through. Both default to every employee.
+    """
+    total = len(employees) if total is None else total
+    reachable = total if reachable is None else reachable
+    page = {'elements': [make_hit(first, last, occupation, start + i)
+                         for i, (first, last, occupation)
+                         in enumerate(employees[start:start + count])],
+            'metadata': {'totalResultCount': total, 'searchId': 'z' * 20},
+            'paging': {'count': count, 'start': start, 'total': reachable, 'links': []}}
+    return json.dumps(page).encode('utf-8')
@@ -0,0 +1,181 @@
+"""
+A local stand-in for the parts of LinkedIn that linkedin.py talks to.
+
+Serves /login, /checkpoint/lg/login-submit, /voyager/api/me, the
+organization/companies lookup and paged search/hits results built from a
+synthetic corpus, so full
+runs can be benchmarked with no network. Like the real site, a single search
+returns at most 1000 results. Keyword searches match on occupation, and
+each employee belongs to one of the GEO_REGIONS for --geoblast.
+
+JSON replies are gzipped for clients that accept it. With --fail-every N,
+every Nth search request gets a 429 or 503 with a Retry-After header, to
+exercise the retries.
+
+Usage: python benchmarks/mock_server.py [--port 8080] [--size 5000] [--latency 0.05]
+                                        [--fail-every 10]
+"""
+import argparse
+import gzip
+import http.cookies
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import linkedin  # noqa: E402
+from corpus import make_employees, make_page  # noqa: E402
+
+COMPANY_ID = '14388394'
+SEARCH_LIMIT = 1000
+REGIONS = list(linkedin.GEO_REGIONS.values())
+
+LOGIN_PAGE = (b'<html><head><title>LinkedIn Login</title></head><body><form>'
+              b'<input name="loginCsrfParam" value="mock-login-csrf" type="hidden">'
+              b'</form></body></html>')
+
+
+class MockVoyagerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, which Nagle would delay.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, status=200, content_type='application/json', headers=()):
+        if content_type == 'application/json' and \
+                'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=6)
+            headers = [*headers, ('Content-Encoding', 'gzip')]
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urllib.parse.urlsplit(self.path)
+        # The search URL holds List(...) values that parse_qs would mangle.
+        query = dict(part.split('=', 1) for part in url.query.split('&') if '=' in part)
+
+        if url.path == '/login':
+            self.send_body(LOGIN_PAGE, content_type='text/html')
+        elif url.path == '/voyager/api/me':
+            # Only sessions this server logged in are valid, so restarting it
+            # expires every saved session.
+            cookies = http.cookies.SimpleCookie(self.headers.get('Cookie', ''))
+            token = cookies['JSESSIONID'].value.strip('"') if 'JSESSIONID' in cookies else None
+            if token in self.server.sessions and self.headers.get('Csrf-Token') == token:
+                self.send_body(json.dumps({'plainId': 1, 'publicIdentifier': 'mock'}).encode())
+            else:
+                self.send_body(b'{"status": 401}', status=401)
+        elif url.path == '/voyager/api/organization/companies':
+            company = {'name': query.get('universalName', 'mock'),
+                       'tagline': 'A company that only exists on this machine',
+                       'staffCount': len(self.server.employees),
+                       'companyPageUrl': 'https://example.com',
+                       'trackingInfo': {'objectUrn': f'urn:li:company:{COMPANY_ID}'}}
+            self.send_body(json.dumps({'elements': [company]}).encode('utf-8'))
+        elif url.path == '/voyager/api/search/hits':
+            self.send_search(query)
+        else:
+            self.send_body(b'{}', status=404)
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+
+        if self.path.startswith('/checkpoint/lg/login-submit'):
+            token = f'ajax:{secrets.randbelow(10 ** 18):018d}'
+            self.server.sessions.add(token)
+            self.send_body(b'', status=302, content_type='text/html',
+                           headers=[('Location', self.server.base_url + '/feed/'),
+                                    ('Set-Cookie', f'JSESSIONID="{token}"; Path=/')])
+        else:
+            self.send_body(b'{}', status=404)
+
+    def send_search(self, query):
+        with self.server.lock:
+            self.server.searches += 1
+            searches = self.server.searches
+        if self.server.fail_every and searches % self.server.fail_every == 0:
+            status = 429 if searches // self.server.fail_every % 2 else 503
+            self.send_body(b'{"status": %d}' % status, status=status,
+                           headers=[('Retry-After', '0')])
+            return
+
+        region = urllib.parse.unquote(query.get('facetGeoRegion', 'List()'))[5:-1]
+        keyword = urllib.parse.unquote(query.get('keywords', 'List()'))[5:-1].lower()
+        start = int(query.get('start', 0))
+        count = int(query.get('count', 25))
+
+        employees = self.server.employees
+        if region:
+            index = REGIONS.index(region)
+            employees = employees[index::len(REGIONS)]
+        if keyword:
+            employees = [employee for employee in employees if keyword in employee[2].lower()]
+
+        # Like the real thing, we only page through the first 1000 results,
+        # though the metadata still gives the full count.
+        reachable = min(len(employees), SEARCH_LIMIT)
+        if start >= reachable:
+            page_employees, start = [], 0
+        else:
+            page_employees = employees
+            count = min(count, reachable - start)
+        self.send_body(make_page(page_employees, start, total=len(employees), count=count,
+                                 reachable=reachable))
+
+
+def start_server(size=5000, port=0, latency=0.0, fail_every=0):
+    """
+    Starts the mock server on a background thread.
+
+    Returns the server, whose base_url can be used as linkedin.BASE_URL.
+    Call server.shutdown() when done.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockVoyagerHandler)
+    server.daemon_threads = True
+    server.employees = make_employees(size)
+    server.latency = latency
+    server.sessions = set()
+    server.fail_every = fail_every
+    server.searches = 0
+    server.lock = threading.Lock()
+    server.base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the LinkedIn voyager API.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--size', type=int, default=5000, help='Number of employees.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before answering each request.')
+    parser.add_argument('--fail-every', type=int, default=0,
+                        help='Answer every Nth search with a 429 or 503.')
+    args = parser.parse_args()
+
+    server = start_server(args.size, args.port, args.latency, args.fail_every)
+    print(f"Serving {args.size} employees at {server.base_url}, Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,43 @@ import os
 import sys
 import re
 import time
+import unicodedata
 import argparse
+import base64
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import csv
+import functools
 import getpass
+import gzip
+import hashlib
+import heapq
+import importlib.util
+import io
+import itertools
 import json
+import math
+import mmap
+import queue
+import sqlite3
+import tempfile
+import threading
 import urllib.parse
-import requests
-import urllib3
 
+# orjson is optional. When installed, it parses the search results several
+# times faster than the standard library. Both take bytes or str.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+# All requests go to this site. Only changed to point the tool at a local
+# stand-in server, such as the one used by the benchmarks.
+BASE_URL = 'https://www.linkedin.com'
 
 # The dictionary below is a best-effort attempt to spread a search load
 # across sets of geographic locations. This can bypass the 1000 result
@@ -31,11 +61,149 @@ GEO_REGIONS = {
     'r12': 'af:0|bh:0|il:0|jo:0|kw:0|pk:0|qa:0|sa:0|ae:0'}
 
 
+# Use case for tool is mostly standard English, so non-English letters are
+# transliterated to plain ones. These are the letters that need spelling out
+# per script; anything with just an accent is handled by the NFKD pass in
+# build_accent_table. Names are lower-cased first, so only lower case is here.
+# Greek υ is mostly seen in ου, as in Papadopoulos, so it is spelled u.
+TRANSLITERATIONS = {
+    'latin': {'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'ø': 'o', 'ð': 'd', 'þ': 'th', 'ĳ': 'ij',
+              'ħ': 'h', 'ŀ': 'l'},
+    'polish': {'ł': 'l'},
+    'turkish': {'ı': 'i'},
+    'vietnamese': {'đ': 'd'},
+    'cyrillic': {
+        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+        'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+        'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+        'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+        'я': 'ya', 'і': 'i', 'ї': 'yi', 'є': 'ye', 'ґ': 'g', 'ђ': 'dj', 'ј': 'j', 'љ': 'lj',
+        'њ': 'nj', 'ћ': 'c', 'џ': 'dz', 'ў': 'u'},
+    'greek': {
+        'α': 'a', 'β': 'v', 'γ': 'g', 'δ': 'd', 'ε': 'e', 'ζ': 'z', 'η': 'i', 'θ': 'th',
+        'ι': 'i', 'κ': 'k', 'λ': 'l', 'μ': 'm', 'ν': 'n', 'ξ': 'x', 'ο': 'o', 'π': 'p',
+        'ρ': 'r', 'σ': 's', 'ς': 's', 'τ': 't', 'υ': 'u', 'φ': 'f', 'χ': 'ch', 'ψ': 'ps',
+        'ω': 'o'}}
+
+# Blocks that build_accent_table runs NFKD over: Latin-1, Latin Extended A
+# and B, Greek, Cyrillic and Latin Extended Additional (Vietnamese).
+TRANSLITERATION_RANGES = ((0x00c0, 0x0250), (0x0370, 0x0400), (0x0400, 0x0530),
+                          (0x1e00, 0x1f00))
+
+
+def build_accent_table(tables):
+    """
+    Builds the single str.translate table used by clean_name.
+
+    Every letter in TRANSLITERATION_RANGES is decomposed (NFKD), its accents
+    dropped and what is left spelled out with the tables, so 'ά' becomes 'a'
+    and 'ё' becomes 'e'. Letters that still don't come out as plain ASCII
+    are left for the regexes to remove. The tables' own entries, and then
+    any later tables, take precedence. Combining accents map to nothing.
+    """
+    spelled = {}
+    for table in tables.values():
+        spelled.update({letter.lower(): text for letter, text in table.items()})
+
+    mapping = dict.fromkeys(range(0x0300, 0x0370), '')
+    for start, end in TRANSLITERATION_RANGES:
+        for code in range(start, end):
+            decomposed = unicodedata.normalize('NFKD', chr(code).lower())
+            text = ''.join(spelled.get(part, part) for part in decomposed
+                           if not unicodedata.combining(part))
+            if text.isascii() and text.isalpha():
+                mapping[code] = text
+    mapping.update(str.maketrans(spelled))
+    return mapping
+
+
+ACCENT_TABLE = build_accent_table(TRANSLITERATIONS)
+
+
+def add_transliteration(table, name='custom'):
+    """
+    Adds a table of letters to spell out, such as {'ä': 'ae', 'ö': 'oe'} for
+    German-style names, overriding the built-in ones. See --transliteration.
+    """
+    global ACCENT_TABLE
+    TRANSLITERATIONS[name] = {**TRANSLITERATIONS.get(name, {}), **table}
+    ACCENT_TABLE = build_accent_table(TRANSLITERATIONS)
+    CLEAN_CACHE.clear()
+
+
+# Cleaned names, most recently used last, so a name seen again (the same
+# people turn up across keyword and region searches) is a dictionary hit.
+CLEAN_CACHE = {}
+CLEAN_CACHE_SIZE = 100000
+
+# Patterns used by clean_name, compiled once. None of them match across a
+# newline, so they can be run over a whole block of newline-separated names.
+PARENTHESES_RE = re.compile(r'\([^()\n]*\)')
+DISALLOWED_CHARS_RE = re.compile('[^a-zA-Z \n-]')
+TITLES_RE = re.compile(r'\b(mr|miss|mrs|phd|prof|professor|md|dr|mba)\b')
+SPACES_RE = re.compile(' +')
+EDGE_SPACES_RE = re.compile('^ | $', re.MULTILINE)
+
+
+# Words that make a compound surname with the words after them, as in
+# 'maria de la cruz' (delacruz) or 'pieter van der berg' (vanderberg).
+NAME_PARTICLES = frozenset({'da', 'das', 'de', 'del', 'della', 'der', 'des', 'di', 'do', 'dos',
+                            'du', 'la', 'las', 'le', 'los', 'st', 'ten', 'ter', 'van', 'von'})
+
+# The most usernames a format makes for one person, with --max-variants.
+MAX_VARIANTS = 6
+
+
 class NameMutator:
 
     def __init__(self, name):
         self.name = self.clean_name(name)
-        self.name = self.split_name(name)
+        self.name = self.split_name(self.name)
+
+    @classmethod
+    def from_parts(cls, first, last, middles=(), surnames=()):
+        """
+        Builds a mutator from a name that has already been cleaned and split,
+        such as one column entry returned by split_names.
+        """
+        mutator = cls.__new__(cls)
+        mutator.name = {'first': first, 'second': surnames[0] if surnames else '',
+                        'last': last, 'middles': middles, 'surnames': surnames}
+        return mutator
+
+    @staticmethod
+    def _clean_text(text):
+        """
+        Runs the cleaning steps over a string holding one or more names
+        separated by newlines.
+        """
+        # Lower-case everything to make it easier to de-duplicate, and
+        # transliterate the non-English characters.
+        text = text.lower().translate(ACCENT_TABLE)
+
+        # Anything from outside the table's blocks, like full-width letters,
+        # gets a decomposition of its own.
+        if not text.isascii():
+            text = unicodedata.normalize('NFKD', text).translate(ACCENT_TABLE)
+
+        # Get rid of all things in parentheses. Lots of people put various credentials, etc
+        text = PARENTHESES_RE.sub('', text)
+
+        # The line below basically trash anything weird left over.
+        # A lot of users have funny things in their names, like () or ''
+        # People like to feel special, I guess.
+        text = DISALLOWED_CHARS_RE.sub('', text)
+
+        # We get rid of common titles.
+        text = TITLES_RE.sub('', text)
+
+        # The lines below tries to consolidate white space between words
+        # and get rid of leading/trailing spaces. Only plain spaces are left
+        # at this point.
+        text = SPACES_RE.sub(' ', text)
+        text = EDGE_SPACES_RE.sub('', text)
+
+        return text
 
     @staticmethod
     def clean_name(name):
@@ -45,40 +213,94 @@ class NameMutator:
         LinkedIn's users tend to add credentials to their names to look special.
         This function is based on what I have seen in large searches, and attempts
         to remove them.
+
+        Results are remembered in CLEAN_CACHE.
         """
-        # Lower-case everything to make it easier to de-duplicate.
-        name = name.lower()
+        cleaned = CLEAN_CACHE.pop(name, None)
+        if cleaned is None:
+            cleaned = NameMutator._clean_text(name.replace('\n', ''))
+            if len(CLEAN_CACHE) >= CLEAN_CACHE_SIZE:
+                del CLEAN_CACHE[next(iter(CLEAN_CACHE))]
+        CLEAN_CACHE[name] = cleaned
+        return cleaned
 
-        # Use case for tool is mostly standard English, try to standardize common non-English
-        # characters.
-        name = re.sub("[àáâãäå]", 'a', name)
-        name = re.sub("[èéêë]", 'e', name)
-        name = re.sub("[ìíîï]", 'i', name)
-        name = re.sub("[òóôõö]", 'o', name)
-        name = re.sub("[ùúûü]", 'u', name)
-        name = re.sub("[ýÿ]", 'y', name)
-        name = re.sub("[ß]", 'ss', name)
-        name = re.sub("[ñ]", 'n', name)
+    @staticmethod
+    def clean_names(names):
+        """
+        Batch version of clean_name. Takes an iterable of names and returns a
+        list of cleaned names in the same order.
 
-        # Get rid of all things in parentheses. Lots of people put various credentials, etc
-        name = re.sub(r'\([^()]*\)', '', name)
+        The names are joined into one block of text so each cleaning step is a
+        single linear pass, rather than one regex call per step per name.
+        Only names that aren't in CLEAN_CACHE are cleaned.
+        """
+        names = list(names)
+        found = {}
+        missing = []
+        for name in dict.fromkeys(names):
+            cleaned = CLEAN_CACHE.pop(name, None)
+            if cleaned is None:
+                missing.append(name)
+            else:
+                found[name] = cleaned
+        if missing:
+            cleaned = NameMutator._clean_text(
+                '\n'.join(name.replace('\n', '') for name in missing)).split('\n')
+            found.update(zip(missing, cleaned))
 
-        # The lines below basically trash anything weird left over.
-        # A lot of users have funny things in their names, like () or ''
-        # People like to feel special, I guess.
-        allowed_chars = re.compile('[^a-zA-Z -]')
-        name = allowed_chars.sub('', name)
+        # These are now the most recently used, and the least recently used go.
+        CLEAN_CACHE.update(found)
+        excess = len(CLEAN_CACHE) - CLEAN_CACHE_SIZE
+        if excess > 0:
+            for name in list(itertools.islice(CLEAN_CACHE, excess)):
+                del CLEAN_CACHE[name]
 
-        # We get rid of common titles.
-        titles = ['mr', 'miss', 'mrs', 'phd', 'prof', 'professor', 'md', 'dr', 'mba']
-        pattern = "\\b(" + "|".join(titles) + ")\\b"
-        name = re.sub(pattern, '', name)
+        return [found[name] for name in names]
+
+    @staticmethod
+    def other_surnames(parsed, words):
+        """
+        Returns the surnames worth trying for a cleaned name besides its last
+        word, most likely first and without repeats, as a tuple. Takes the
+        name split into words, and with hyphens taken as spaces (parsed).
+
+        That is the name right before the last one, as it always was, then
+        a compound of a hyphenated or particled surname ('nunezgarcia',
+        'delacruz'), then the rest of the middle names, right to left.
+        Particles on their own are skipped.
+        """
+        candidates = parsed[-2:0:-1]
 
-        # The line below tries to consolidate white space between words
-        # and get rid of leading/trailing spaces.
-        name = re.sub(r'\s+', ' ', name).strip()
+        start = len(words) - 1
+        while start > 1 and words[start - 1] in NAME_PARTICLES:
+            start -= 1
+        if len(words) > 1 and (start < len(words) - 1 or '-' in words[-1]):
+            candidates.insert(1, ''.join(words[start:]).replace('-', ''))
 
-        return name
+        # Only a handful of names, so a list beats a set here.
+        found = [parsed[-1]]
+        for surname in candidates:
+            if surname not in found and surname not in NAME_PARTICLES:
+                found.append(surname)
+        return tuple(found[1:])
+
+    @staticmethod
+    def split_parts(name, parsed):
+        """
+        Splits a cleaned name of three or more parts (parsed, with hyphens
+        taken as spaces) into (first, middles, last, surnames).
+
+        middles are the words between the first and the last, with hyphenated
+        ones taken apart, for the {middle} and {m} template fields. surnames
+        are the others worth trying besides the last (see other_surnames).
+        Particles like 'de' are neither.
+        """
+        words = name.split()
+        middles = ()
+        if len(words) > 2:
+            middles = tuple(part for word in words[1:-1] for part in word.split('-')
+                            if part and part not in NAME_PARTICLES)
+        return parsed[0], middles, parsed[-1], NameMutator.other_surnames(parsed, words)
 
     @staticmethod
     def split_name(name):
@@ -87,157 +309,757 @@ class NameMutator:
 
         Some people have funny names. We assume the most important name are:
         first name, last name, and the name of right before the last name (if they have one)
+
+        The middle names and the other surnames worth trying are there too,
+        as tuples (see split_parts).
+
+        A name that cleaned down to nothing comes back as empty parts.
         """
-        parsed = re.split(' |-', name)
+        parsed = name.replace('-', ' ').split() or ['']
 
         if len(parsed) > 2:
-            split_name = {'first': parsed[0], 'second': parsed[-2], 'last': parsed[-1]}
+            first, middles, last, surnames = NameMutator.split_parts(name, parsed)
+            split_name = {'first': first, 'second': parsed[-2], 'last': last,
+                          'middles': middles, 'surnames': surnames}
         else:
-            split_name = {'first': parsed[0], 'second': '', 'last': parsed[-1]}
+            split_name = {'first': parsed[0], 'second': '', 'last': parsed[-1],
+                          'middles': (), 'surnames': ()}
 
         return split_name
 
+    @staticmethod
+    def split_names(names):
+        """
+        Batch version of split_name. Takes an iterable of cleaned names and
+        returns columnar (first, last, middles, surnames) lists instead of a
+        dict per name.
+        """
+        firsts, lasts, middles, surnames = [], [], [], []
+        for name in names:
+            parsed = name.replace('-', ' ').split() or ['']
+            if len(parsed) > 2:
+                first, name_middles, last, name_surnames = NameMutator.split_parts(name, parsed)
+            else:
+                # Most names, with nothing in between.
+                first, name_middles, last, name_surnames = parsed[0], (), parsed[-1], ()
+            firsts.append(first)
+            lasts.append(last)
+            middles.append(name_middles)
+            surnames.append(name_surnames)
+
+        return firsts, lasts, middles, surnames
+
+    def _parts(self):
+        return self.name['first'], self.name['last'], self.name['middles'], self.name['surnames']
+
+    def apply(self, template):
+        """Formats this name with a UsernameTemplate, returning a tuple of usernames."""
+        return template(*self._parts())
+
+    def variants(self, template):
+        """Like apply, but generates the usernames one at a time."""
+        return template.variants(*self._parts())
+
+    # The templates never repeat a username, so these return their tuples as is.
     def f_last(self):
         """rahulsharma"""
-        names = set()
-        names.add(self.name['first'][0] + self.name['last'])
+        return self.apply(BUILTIN_FORMATS['flast'])
 
-        if self.name['second']:
-            names.add(self.name['first'][0] + self.name['second'])
+    def f_dot_last(self):
+        """rahul.sharma"""
+        return self.apply(BUILTIN_FORMATS['f.last'])
 
-        return names
+    def last_f(self):
+        """sharmarahul"""
+        return self.apply(BUILTIN_FORMATS['last_f'])
 
-    def f_dot_last(self):
+    def first_dot_last(self):
         """rahul.sharma"""
-        names = set()
-        names.add(self.name['first'][0] + '.' + self.name['last'])
+        return self.apply(BUILTIN_FORMATS['first.last'])
 
-        if self.name['second']:
-            names.add(self.name['first'][0] + '.' + self.name['second'])
+    def first_l(self):
+        """rahuls"""
+        return self.apply(BUILTIN_FORMATS['first_l'])
 
-        return names
+    def first(self):
+        """rahul"""
+        return self.apply(BUILTIN_FORMATS['first'])
 
-    def last_f(self):
-        """sharmarahul"""
-        names = set()
-        names.add(self.name['last'] + self.name['first'][0])
 
-        if self.name['second']:
-            names.add(self.name['second'] + self.name['first'][0])
+# Fields that can be used in a username template, mapped to the expression
+# that computes them from the first name, a middle name and a surname.
+TEMPLATE_FIELDS = {
+    'first': 'first',
+    'f': 'first[:1]',
+    'middle': 'middle',
+    'm': 'middle[:1]',
+    'last': 'last',
+    'l': 'last[:1]'}
 
-        return names
+TEMPLATE_FIELD_RE = re.compile(r'\{(\w+)(?::(\d+))?\}')
+FORMAT_NAME_RE = re.compile(r'^[\w.-]+$')
 
-    def first_dot_last(self):
-        """rahul.sharma"""
-        names = set()
-        names.add(self.name['first'] + '.' + self.name['last'])
+# The other {company}-*.txt files OutputWriter writes, which a format can't be named.
+RESERVED_FORMAT_NAMES = ('raw-names', 'meta-data')
 
-        if self.name['second']:
-            names.add(self.name['first'] + '.' + self.name['second'])
 
-        return names
+class UsernameTemplate:
+    """
+    A username format, such as '{f}{last}', '{first}_{l}' or '{last}{first:3}'.
 
-    def first_l(self):
-        """rahuls"""
-        names = set()
-        names.add(self.name['first'] + self.name['last'][0])
+    {first}, {middle} and {last} are the first, middle and last names, {f},
+    {m} and {l} are their initials, and ':N' keeps only the first N
+    characters. Anything else is copied as is. The template is compiled once
+    into a single expression, so formatting a name costs the same as a
+    hand-written method would.
 
-        if self.name['second']:
-            names.add(self.name['first'] + self.name['second'][0])
+    Like the original formats, a template that uses the last name is also
+    applied to the name right before it, if there is one, and then to the
+    other surnames split_name found. A template that uses the middle name is
+    applied to each of them, and makes nothing for people without one. That
+    is up to limit usernames per person, skipping repeats.
 
-        return names
+    Usernames found in any of the exclude filters (see --exclude) are dropped.
+    """
 
-    def first(self):
-        """rahul"""
-        names = set()
-        names.add(self.name['first'])
+    def __init__(self, template, exclude=None, limit=MAX_VARIANTS):
+        self.template = template
+        self.exclude = exclude
+        self.limit = limit
+        self.uses_last = False
+        self.uses_middle = False
+
+        pieces = []
+        position = 0
+        for match in TEMPLATE_FIELD_RE.finditer(template):
+            pieces.append(self._literal(template[position:match.start()]))
+            field, width = match.groups()
+            if field not in TEMPLATE_FIELDS:
+                raise ValueError(f"Unknown field '{{{field}}}' in username template '{template}'")
+            if field in ('last', 'l'):
+                self.uses_last = True
+            if field in ('middle', 'm'):
+                self.uses_middle = True
+            pieces.append(TEMPLATE_FIELDS[field] + (f'[:{width}]' if width else ''))
+            position = match.end()
+        pieces.append(self._literal(template[position:]))
+
+        # Only the field expressions above and repr()'d literals end up in here.
+        expression = ' + '.join(piece for piece in pieces if piece) or "''"
+        self.formatter = eval(f'lambda first, middle, last: {expression}',
+                              {'__builtins__': {}})
+
+    def _literal(self, text):
+        if '{' in text or '}' in text:
+            raise ValueError(f"Malformed field in username template '{self.template}'")
+        return repr(text) if text else ''
+
+    def __reduce__(self):
+        # The compiled lambda can't be pickled, so process pool workers recompile it.
+        return UsernameTemplate, (self.template, self.exclude, self.limit)
+
+    @property
+    def key(self):
+        """What the usernames made depend on, to tell when saved ones are stale."""
+        return f'{self.template}|{self.limit}'
+
+    def variants(self, first, last, middles=(), surnames=()):
+        """
+        Generates the usernames for one split name (see split_parts), one at
+        a time, stopping at the limit. Nothing is made until it is asked for.
+        """
+        # Names that cleaned down to nothing have no usernames, and neither
+        # do people without a middle name when the template needs one.
+        if not first or (self.uses_middle and not middles):
+            return
+        if not self.uses_last:
+            surnames = ()
+        if not self.uses_middle:
+            middles = ('',)
+        # Excluded usernames are remembered as made, but only the ones given
+        # out count against the limit.
+        made = []
+        given = 0
+        for surname in itertools.chain((last,), surnames):
+            for middle in middles:
+                # Middle names are tried as surnames too, but not as both at once.
+                if middle == surname:
+                    continue
+                username = self.formatter(first, middle, surname)
+                # A few usernames at most, so a list beats a set here.
+                if username in made:
+                    continue
+                made.append(username)
+                if self.exclude and any(username in bloom for bloom in self.exclude):
+                    continue
+                yield username
+                given += 1
+                if given >= self.limit:
+                    return
+
+    def __call__(self, first, last, middles=(), surnames=()):
+        """Returns a tuple of the usernames for one split name."""
+        # Most names have no other surnames and nothing to exclude.
+        if first and not self.exclude and not self.uses_middle \
+                and not (surnames and self.uses_last):
+            return (self.formatter(first, '', last),)
+        return tuple(self.variants(first, last, middles, surnames))
+
+
+# The built-in username formats, by output file suffix.
+NAME_FORMATS = {
+    'flast': '{f}{last}',
+    'f.last': '{f}.{last}',
+    'first_l': '{first}{l}',
+    'first.last': '{first}.{last}',
+    'first': '{first}',
+    'last_f': '{last}{f}'}
+
+BUILTIN_FORMATS = {name: UsernameTemplate(template) for name, template in NAME_FORMATS.items()}
+
+
+def load_formats(cli_formats=None, formats_file=None, exclude=None, limit=MAX_VARIANTS):
+    """
+    Returns the username formats to write, by output file suffix.
+
+    These are the built-in formats plus any given as NAME=TEMPLATE on the
+    command line or in a formats file, one per line. Lines starting with a
+    '#' are ignored. A format with the same name as a built-in replaces it.
+    Names of the other output files (RESERVED_FORMAT_NAMES), and names that
+    only differ from another format's in case, are refused, as their files
+    would overwrite each other.
+
+    Every format drops the usernames in the exclude filters, if given, and
+    makes at most limit usernames per person.
+    """
+    formats = dict(BUILTIN_FORMATS)
+    if exclude or limit != MAX_VARIANTS:
+        formats = {name: UsernameTemplate(template.template, exclude, limit)
+                   for name, template in formats.items()}
+
+    specs = []
+    if formats_file:
+        with open(formats_file, encoding='utf-8') as infile:
+            specs.extend(line.strip() for line in infile
+                         if line.strip() and not line.lstrip().startswith('#'))
+    specs.extend(cli_formats or [])
+
+    for spec in specs:
+        name, separator, template = spec.partition('=')
+        name, template = name.strip(), template.strip()
+        if not separator or not FORMAT_NAME_RE.match(name):
+            raise ValueError(f"Expected a username format as NAME=TEMPLATE, got '{spec}'")
+        # Output files can share a directory on a case-insensitive file system.
+        if name.lower() in RESERVED_FORMAT_NAMES:
+            raise ValueError(f"'{name}' can't be a username format name, as the"
+                             f" {{company}}-{name.lower()}.txt file is already written")
+        clash = next((other for other in formats
+                      if other != name and other.lower() == name.lower()), None)
+        if clash:
+            raise ValueError(f"Username formats '{name}' and '{clash}' would write the same"
+                             " file on some systems. Pick another name.")
+        formats[name] = UsernameTemplate(template, exclude, limit)
+
+    return formats
+
+
+class BloomFilter:
+    """
+    A compact, probabilistic set of usernames, for --exclude.
+
+    Lists of known accounts can run to millions of entries, so rather than
+    keeping them all in a set, each username only sets a few bits. Lookups
+    never miss a username that was added, and wrongly match one that wasn't
+    at about the error_rate it was sized for.
+
+    Usernames are compared lowercased and without any @domain, so lists of
+    email addresses and bare usernames both work.
+
+    Filters are saved to and loaded from a file with a short JSON header
+    followed by the raw bits.
+    """
+    MAGIC = b'liUC-bloom 1\n'
+
+    def __init__(self, capacity, error_rate=0.001, size=None, hashes=None, count=0, bits=None):
+        # The usual sizing: m = -n ln(p) / ln(2)^2 bits and k = m/n ln(2) hashes.
+        capacity = max(capacity, 1)
+        self.size = size or max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = hashes or max(round(self.size / capacity * math.log(2)), 1)
+        self.count = count
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
 
-        return names
+    @staticmethod
+    def normalize(username):
+        return username.strip().lower().partition('@')[0]
+
+    @staticmethod
+    def _hash(username):
+        # Two halves of one hash make every probe (double hashing).
+        value = int.from_bytes(
+            hashlib.blake2b(username.encode('utf-8'), digest_size=16).digest(), 'little')
+        return value & 0xFFFFFFFFFFFFFFFF, value >> 64 | 1
+
+    def add(self, username):
+        position, step = self._hash(self.normalize(username))
+        for _ in range(self.hashes):
+            position %= self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+            position += step
+        self.count += 1
+
+    def __contains__(self, username):
+        # Generated usernames are already lowercase without a domain, and
+        # most aren't in the filter, so this usually stops at the first bit.
+        position, step = self._hash(username)
+        bits, size = self.bits, self.size
+        for _ in range(self.hashes):
+            position %= size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+    def save(self, path):
+        header = {'size': self.size, 'hashes': self.hashes, 'count': self.count}
+        with open(path + '.tmp', 'wb') as outfile:
+            outfile.write(self.MAGIC)
+            outfile.write(json.dumps(header).encode() + b'\n')
+            outfile.write(self.bits)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as infile:
+            if infile.readline() != cls.MAGIC:
+                raise ValueError(f"{path} is not a saved username filter")
+            header = json.loads(infile.readline())
+            bits = bytearray(infile.read())
+        if len(bits) != (header['size'] + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        return cls(header['count'], size=header['size'], hashes=header['hashes'],
+                   count=header['count'], bits=bits)
+
+    @classmethod
+    def from_list(cls, path, error_rate=0.001):
+        """Builds a filter from a file of usernames or email addresses, one per line."""
+        with open(path, encoding='utf-8', errors='replace') as infile:
+            capacity = sum(1 for line in infile if line.strip())
+        bloom = cls(capacity, error_rate)
+        with open(path, encoding='utf-8', errors='replace') as infile:
+            for line in infile:
+                if line.strip():
+                    bloom.add(line)
+        return bloom
 
+    @staticmethod
+    def is_saved(path):
+        with open(path, 'rb') as infile:
+            return infile.read(len(BloomFilter.MAGIC)) == BloomFilter.MAGIC
+
+
+def load_exclusions(paths):
+    """
+    Returns a BloomFilter for each --exclude path.
 
-def parse_arguments(email, company):
+    A path can be a saved filter, or a list of usernames. A list is turned
+    into a filter saved next to it as LIST.bloom, which later runs load
+    instead, for as long as it is newer than the list.
+    """
+    filters = []
+    for path in paths:
+        if BloomFilter.is_saved(path):
+            bloom = BloomFilter.load(path)
+            source = 'saved filter'
+        else:
+            saved = path + '.bloom'
+            if os.path.exists(saved) and os.path.getmtime(saved) >= os.path.getmtime(path):
+                bloom = BloomFilter.load(saved)
+                source = f'reusing {saved}'
+            else:
+                bloom = BloomFilter.from_list(path)
+                bloom.save(saved)
+                source = f'saved as {saved}'
+        print(f"[*] Excluding {bloom.count} known usernames in {path}"
+              f" ({len(bloom.bits) // 1024} KB, {source})")
+        filters.append(bloom)
+    return filters
+
+
+# Subcommands, and the one used when none is given.
+COMMANDS = ('crawl', 'replay', 'ingest', 'mutate', 'export', 'query', 'stats')
+DEFAULT_COMMAND = 'crawl'
+
+
+def parse_arguments(argv=None):
     """
     Handle user-supplied arguments
+
+    Nothing here is interactive. The password prompt, when crawling without
+    -p or LIUC_PASSWORD from a terminal, only comes once login() needs it.
     """
-    if not company:
-        company = 'wilson-security'
+    argv = list(sys.argv[1:] if argv is None else argv)
+
+    # Older command lines have no subcommand, so those are crawls.
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv.insert(0, DEFAULT_COMMAND)
 
     desc = ('OSINT tool to generate lists of probable usernames from a'
             ' given company\'s LinkedIn page. This tool may break when'
             ' LinkedIn changes their site.')
 
-    parser = argparse.ArgumentParser(description=desc)
-
-    parser.add_argument('-u', '--username', type=str, action='store',
-                        required=False,
-                        default=f'{email}',
-                        help='A valid LinkedIn username.')
-    parser.add_argument('-c', '--company', type=str, action='store',
-                        required=False,
-                        default=f'{company}',
+    # Options shared by every subcommand.
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-c', '--company', type=str, action='store',
+                        default='wilson-security',
                         help='Company name exactly as typed in the company '
-                             'linkedin profile page URL.')
-    parser.add_argument('-p', '--password', type=str, action='store',
-                        help='Specify your password in clear-Test on the '
-                             'command line. If not specified, will prompt and '
-                             'obfuscate as you type.')
-    parser.add_argument('-n', '--domain', type=str, action='store',
+                             'linkedin profile page URL. Also used to name the '
+                             'output files.')
+    common.add_argument('-o', '--output', default="liUC-output", action="store",
+                        help='Output Directory, defaults to liUC-output')
+
+    # Options for everything that writes username files.
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('-n', '--domain', type=str, action='store',
                         default='',
                         help='Append a domain name to username output. '
                              '[example: "-n uber.com" would output nikita@uber.com]')
-    parser.add_argument('-d', '--depth', type=int, action='store',
+    output.add_argument('--format', type=str, action='append', default=[],
+                        help='Extra username format to write, as NAME=TEMPLATE.'
+                             ' Can be used more than once. [example: --format'
+                             ' "first_l3={first}_{last:3}" would output'
+                             ' nikita_sha to {company}-first_l3.txt]')
+    output.add_argument('--formats-file', type=str, action='store', default=None,
+                        help='File of extra username formats, one NAME=TEMPLATE'
+                             ' per line.')
+    output.add_argument('--transliteration', type=str, action='store', default=None,
+                        help='JSON file of extra letters to spell out in names,'
+                             ' overriding the built-in ones. [example:'
+                             ' {"ä": "ae", "ö": "oe", "ü": "ue"}]')
+    output.add_argument('--exclude', type=str, action='append', default=[],
+                        help='File of known usernames or email addresses, one per'
+                             ' line, to leave out of the output. Can be used more'
+                             ' than once. Each list is turned into a compact filter'
+                             ' saved as FILE.bloom, which can also be given here.')
+    output.add_argument('--max-variants', type=int, action='store', default=MAX_VARIANTS,
+                        help='Most usernames to make for one person in each format,'
+                             ' for people with several middle names or compound'
+                             f' surnames. Defaults to {MAX_VARIANTS}.')
+    output.add_argument('--sink', choices=SINKS, default='files',
+                        help='Where the output goes: plain .txt files (the default),'
+                             ' .txt.gz or .txt.zst files, or jsonl for one JSON line'
+                             ' per person with all of their usernames on stdout.'
+                             ' zstd needs the zstandard package.')
+    output.add_argument('--dedup', default=False, action="store_true",
+                        help='Remove usernames repeated across people (all the'
+                             ' jsmiths) from each format file once written.')
+    output.add_argument('--sort', default=False, action="store_true",
+                        help='Sort each format file once written. Implies --dedup.')
+    output.add_argument('--max-memory', type=int, action='store', default=256,
+                        help='Roughly how many MB --dedup and --sort can hold in'
+                             ' memory before spilling to disk, defaults to 256.')
+    output.add_argument('--profile', default=False, action="store_true",
+                        help='Run each stage under cProfile and save the'
+                             ' profiles to the output directory.')
+
+    # Options for running a search, live or from the cache.
+    search = argparse.ArgumentParser(add_help=False)
+    search.add_argument('-d', '--depth', type=int, action='store',
                         default=False,
                         help='Search depth (how many loops of 25). If unset, '
                              'will try to grab them all.')
-    parser.add_argument('-s', '--sleep', type=int, action='store', default=0,
-                        help='Seconds to sleep between search loops.'
-                             ' Defaults to 0.')
-    parser.add_argument('-x', '--proxy', type=str, action='store',
-                        default=False,
-                        help='Proxy server to use.WARNING: WILL DISABLE SSL '
-                             'VERIFICATION. [example: "-p https://localhost:8080"]')
-    parser.add_argument('-k', '--keywords', type=str, action='store',
+    search.add_argument('-k', '--keywords', type=str, action='store',
                         default=False,
                         help='Filter results by a a list of command separated '
                              'keywords. Will do a separate loop for each keyword, '
                              'potentially bypassing the 1,000 record limit. '
                              '[example: "-k \'sales,human resources,information '
                              'technology\']')
-    parser.add_argument('-g', '--geoblast', default=False, action="store_true",
+    search.add_argument('-g', '--geoblast', default=False, action="store_true",
                         help='Attempts to bypass the 1,000 record search limit'
                              ' by running multiple searches split across geographic'
                              ' regions.')
-    parser.add_argument('-o', '--output', default="liUC-output", action="store",
-                        help='Output Directory, defaults to liUC-output')
+    search.add_argument('--stream', default=False, action="store_true",
+                        help='Write the output files as each page of results'
+                             ' arrives, instead of keeping every employee in'
+                             ' memory until the end.')
+    search.add_argument('--pipeline', default=False, action="store_true",
+                        help='Parse and write each page in the background while'
+                             ' the next one is requested, instead of in between'
+                             ' requests. Requests keep the same pace.')
+    search.add_argument('--resume', default=False, action="store_true",
+                        help='Continue an interrupted search from the checkpoint'
+                             ' journal in the output directory, instead of'
+                             ' starting again from the first page.')
+    search.add_argument('--cache-dir', default="liUC-cache", action="store",
+                        help='Cache directory, defaults to liUC-cache')
+    search.add_argument('--db', type=str, action='store', default=None,
+                        help='SQLite file to keep employees and usernames in'
+                             ' across runs. Only people new to it are mutated,'
+                             ' and the output files are exported from it.')
 
-    args = parser.parse_args()
-
-    # Proxy argument is fed to requests as a dictionary, setting this now:
-    args.proxy_dict = {"https": args.proxy}
+    parser = argparse.ArgumentParser(description=desc)
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+
+    crawl = subparsers.add_parser('crawl', parents=[common, output, search],
+                                  help='Log in and search LinkedIn. This is the default.')
+    crawl.add_argument('-u', '--username', type=str, action='store',
+                       default=os.environ.get('LIUC_USERNAME'),
+                       help='A valid LinkedIn username. Defaults to the '
+                            'LIUC_USERNAME environment variable.')
+    crawl.add_argument('-p', '--password', type=str, action='store',
+                       default=os.environ.get('LIUC_PASSWORD'),
+                       help='Specify your password in clear-Test on the '
+                            'command line, or in the LIUC_PASSWORD environment '
+                            'variable. If not specified, will prompt and '
+                            'obfuscate as you type.')
+    crawl.add_argument('--session-file', type=str, action='store',
+                       default=os.environ.get('LIUC_SESSION_FILE'),
+                       help='Save the logged in session to this file, readable'
+                            ' only by you, and reuse it on later runs while it'
+                            ' is still valid, skipping the login and password.'
+                            ' Defaults to the LIUC_SESSION_FILE environment'
+                            ' variable.')
+    crawl.add_argument('-s', '--sleep', type=int, action='store', default=0,
+                       help='Seconds to sleep between search loops.'
+                            ' Defaults to 0.')
+    crawl.add_argument('--retries', type=int, action='store', default=5,
+                       help='Times to retry a request that fails or gets a 429 or 5xx'
+                            ' response. Defaults to 5.')
+    crawl.add_argument('--backoff', type=float, action='store', default=1.0,
+                       help='Back off between retries: the first is immediate, the'
+                            ' next waits twice this many seconds, doubling each time,'
+                            ' unless the server sends Retry-After. Defaults to 1.')
+    crawl.add_argument('--max-retry-wait', type=int, action='store', default=300,
+                       help='Longest wait before a retry in seconds, including'
+                            ' Retry-After. Defaults to 300.')
+    crawl.add_argument('--timeout', type=float, action='store', default=30,
+                       help='Seconds to wait for a connection or a response'
+                            ' before trying again. Defaults to 30.')
+    crawl.add_argument('-x', '--proxy', type=str, action='store',
+                       default=False,
+                       help='Proxy server to use.WARNING: WILL DISABLE SSL '
+                            'VERIFICATION. [example: "-p https://localhost:8080"]')
+    crawl.add_argument('--cache', default=False, action="store_true",
+                       help='Save raw API responses to the cache directory'
+                            ' and reuse them on later runs.')
+    crawl.add_argument('--cache-ttl', type=int, action='store', default=24,
+                       help='Hours a cached response stays valid. Defaults to 24.')
+    crawl.add_argument('--cache-size', type=int, action='store', default=500,
+                       help='Maximum size of the cache in MB. Defaults to 500.')
+    crawl.set_defaults(replay=False)
+
+    replay = subparsers.add_parser('replay', parents=[common, output, search],
+                                   help='Rebuild the output files from the cache only,'
+                                        ' without logging in or making any network'
+                                        ' calls. Cached responses are used regardless'
+                                        ' of age.')
+    replay.set_defaults(replay=True, sleep=0, proxy=False, cache=False, cache_ttl=None,
+                        cache_size=500)
+
+    ingest = subparsers.add_parser('ingest', parents=[common, output],
+                                   help='Build the output files from saved search/hits'
+                                        ' responses instead of searching LinkedIn.')
+    ingest.add_argument('path',
+                        help='A directory of saved responses, or a HAR file.')
+    ingest.add_argument('--workers', type=int, action='store', default=None,
+                        help='Worker processes. Defaults to the number of CPUs.')
+
+    mutate = subparsers.add_parser('mutate', parents=[common, output],
+                                   help='Write the username files for a list of names,'
+                                        ' such as an earlier raw-names file.')
+    mutate.add_argument('names', nargs='+',
+                        help='Files with one full name per line.')
+    mutate.add_argument('--workers', type=int, action='store', default=None,
+                        help='Worker processes for lists over 4 MB. Defaults to the'
+                             ' number of CPUs.')
+
+    export = subparsers.add_parser('export', parents=[common, output],
+                                   help='Write the output files from a --db store.')
+    export.add_argument('--db', type=str, action='store', required=True,
+                        help='SQLite file written by crawl or replay --db.')
+    export.add_argument('--since', type=int, action='store', default=0,
+                        help='Only export the usernames added after this run'
+                             ' number, to {company}-since-{run}-*.txt files.')
+
+    query = subparsers.add_parser('query', parents=[common, output],
+                                  help='Print the usernames of employees in a --db store'
+                                       ' whose occupation matches.')
+    query.add_argument('terms', nargs='+',
+                       help='Words or phrases to find in occupations, any of which'
+                            ' can match. End one with * to match it as a prefix.')
+    query.add_argument('--db', type=str, action='store', required=True,
+                       help='SQLite file written by crawl or replay --db.')
+    query.add_argument('--names', default=False, action="store_true",
+                       help='Print the matching names and occupations as CSV'
+                            ' instead of usernames.')
+
+    subparsers.add_parser('stats', parents=[common],
+                          help='Summarize the metrics and output files of an earlier run.')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        return args
 
     # If appending an email address, preparing this string now:
     if args.domain:
         args.domain = '@' + args.domain
 
-        # Keywords are fed in as a list. Splitting comma-separated user input now:
+    # Transliterations, exclusions and username templates are loaded once, up front.
+    try:
+        if args.transliteration:
+            with open(args.transliteration, encoding='utf-8') as infile:
+                table = json.load(infile)
+            if not isinstance(table, dict):
+                raise ValueError(f"{args.transliteration} should hold a JSON object of"
+                                 " letters to their spelling")
+            add_transliteration(table)
+        exclude = load_exclusions(args.exclude) if args.exclude else None
+        if args.max_variants < 1:
+            raise ValueError("--max-variants has to be at least 1")
+        if args.max_memory < 1:
+            raise ValueError("--max-memory has to be at least 1 (MB)")
+        args.formats = load_formats(args.format, args.formats_file, exclude, args.max_variants)
+    except (ValueError, OSError) as error:
+        print(f"[!] {error}")
+        sys.exit(1)
+
+    if args.sink == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        print("[!] --sink zstd needs the zstandard package. Try 'pip install zstandard'.")
+        sys.exit(1)
+    if args.sink == 'jsonl' and (args.dedup or args.sort):
+        print("[!] --dedup and --sort work on output files, which --sink jsonl doesn't write.")
+        sys.exit(1)
+    # Where --sink jsonl writes its records. main() sets it to its stdout,
+    # otherwise they go to sys.stdout as it is when writing starts.
+    args.records = None
+
+    # Files are named after the company, and exports since a run say so.
+    args.prefix = args.company
+    if args.command == 'export' and args.since:
+        args.prefix = f'{args.company}-since-{args.since}'
+
+    if args.command not in ('crawl', 'replay'):
+        return args
+
+    # Without -d, the search depth is only a guess from the staff count
+    # (see set_inner_loops), which each search's own paging total replaces.
+    args.depth_given = bool(args.depth)
+
+    # Proxy argument is fed to requests as a dictionary, setting this now:
+    args.proxy_dict = {"https": args.proxy}
+
+    # Keywords are fed in as a list. Splitting comma-separated user input now:
     if args.keywords:
         args.keywords = args.keywords.split(',')
 
-        # These two functions are not currently compatible, squashing this now:
+    # These two functions are not currently compatible, squashing this now:
     if args.keywords and args.geoblast:
         print("Sorry, keywords and geoblast are currently not compatible. Use one or the other.")
-        sys.exit()
+        sys.exit(1)
 
-        # If password is not passed in the command line, prompt for it
-    # in a more secure fashion (not shown on screen)
-    args.password = args.password or getpass.getpass()
+    # A saved session can stand in for the username. The password, if it
+    # turns out to be needed, is asked for by login().
+    if args.command == 'crawl' and not args.username and not args.session_file:
+        print("[!] No LinkedIn username given. Use -u or set LIUC_USERNAME.")
+        sys.exit(1)
 
     return args
 
 
-def login(args):
+def login(args, metrics=None):
+    """
+    Returns an authenticated session, or False.
+
+    With --session-file, a session saved by an earlier run is reused while
+    it is still valid, so there is no login flow and no password is needed.
+    Otherwise we log in with the password (see login_with_password), and
+    save the new session to the file for next time.
+    """
+    # requests' errors are OSErrors, and by now the retries are used up.
+    try:
+        session = load_session(args, metrics)
+        if session:
+            print(f"[*] Reusing the saved session in {args.session_file}")
+            return session
+
+        session = login_with_password(args, metrics)
+    except OSError as error:
+        print(f"[!] Yikes, could not reach LinkedIn to log in: {error}")
+        sys.exit(1)
+
+    if session and args.session_file:
+        save_session(session, args.session_file, args.username)
+        print(f"[*] Saved the session to {args.session_file}")
+    return session
+
+
+# HTTP errors worth trying again, as they are usually gone a moment later.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Connections kept open to each host. Searches go out one at a time, so this
+# leaves room for the odd overlapping request without opening new ones.
+HTTP_POOL_SIZE = 4
+
+
+def mount_transport(session, args, metrics=None):
+    """
+    Gives the session retries, timeouts and a sized connection pool.
+
+    Failed connections and the statuses in RETRY_STATUSES are retried up to
+    --retries times, waiting as long as a Retry-After header asks (up to
+    --max-retry-wait) or backing off exponentially from --backoff seconds.
+    Only GETs are retried, never the login POST. Once the retries run out
+    the last response is returned as usual, so callers still see the error.
+
+    Every request without its own timeout gets --timeout. With a RunMetrics,
+    the retries and the time spent waiting for them are counted.
+    """
+    import requests.adapters
+    import urllib3
+
+    class ReportingRetry(urllib3.util.Retry):
+        # Worked out here rather than with backoff_max, which urllib3 1.x
+        # doesn't have (it always caps the back off at 120 seconds).
+        def get_backoff_time(self):
+            errors = len(list(itertools.takewhile(lambda entry: entry.redirect_location is None,
+                                                  reversed(self.history))))
+            if errors <= 1:
+                return 0
+            return min(args.max_retry_wait, self.backoff_factor * 2 ** (errors - 1))
+
+        def get_retry_after(self, response):
+            retry_after = super().get_retry_after(response)
+            return None if retry_after is None else min(retry_after, args.max_retry_wait)
+
+        # urllib3 sleeps through this before each retry.
+        def sleep(self, response=None):
+            start = time.perf_counter()
+            super().sleep(response)
+            if metrics:
+                last = self.history[-1] if self.history else None
+                reason = last.status if last and last.status else 'connection'
+                metrics.count('http_retries')
+                metrics.count(f'http_retries_{reason}')
+                metrics.count('http_retry_wait_seconds', time.perf_counter() - start)
+
+    class TimeoutAdapter(requests.adapters.HTTPAdapter):
+        def send(self, request, timeout=None, **kwargs):
+            return super().send(request, timeout=timeout or args.timeout, **kwargs)
+
+    retry = ReportingRetry(total=args.retries, status_forcelist=RETRY_STATUSES,
+                           allowed_methods=frozenset({'GET', 'HEAD'}),
+                           backoff_factor=args.backoff,
+                           respect_retry_after_header=True, raise_on_status=False)
+    adapter = TimeoutAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                             max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def new_session(args, metrics=None):
     """
-    Creates a new authenticated session.
+    Returns a requests session with our headers and proxy, not yet logged in.
 
     Note that a mobile user agent is used. Parsing using the desktop results
     proved extremely difficult, as shared connections would be returned in
@@ -246,14 +1068,19 @@ def login(args):
     The other header matters as well, otherwise advanced search functions
     (region and keyword) will not work.
 
-    The function will check for common failure scenarios - the most common is
-    logging in from a new location. Accounts using multi-factor auth are not
-    yet supported and will produce an error.
+    If a RunMetrics is given, every HTTP call made with the session is timed.
+    Retries, timeouts and pooling are set up by mount_transport.
     :rtype: requests.sessions.Session
     """
+    # The network stack is only imported by the commands that need it, which
+    # keeps start up fast for offline work.
+    import requests
+    import urllib3
+
     session = requests.session()
-    # The following are know errors that require the user to log in via the web
-    login_problems = ['challenge', 'captcha', 'manage-account', 'add-email']
+    if metrics:
+        session.hooks['response'].append(metrics.record_response)
+    mount_transport(session, args, metrics)
 
     # Special options below when using a proxy server. Helpful for debugging
     # the application in Burp Suite.
@@ -271,9 +1098,41 @@ def login(args):
     session.headers.update({'User-Agent': mobile_agent,
                             'X-RestLi-Protocol-Version': '2.0.0'})
 
+    # The JSON compresses very well. urllib3 lists the encodings it can
+    # decode here, which includes br (and zstd) when brotli (or zstandard)
+    # is installed.
+    session.headers['Accept-Encoding'] = urllib3.util.request.ACCEPT_ENCODING
+    return session
+
+
+def login_with_password(args, metrics=None):
+    """
+    Creates a new authenticated session by going through the login form.
+
+    The function will check for common failure scenarios - the most common is
+    logging in from a new location. Accounts using multi-factor auth are not
+    yet supported and will produce an error.
+    :rtype: requests.sessions.Session
+    """
+    # The password is only asked for now, when there was no saved session to use.
+    if not args.username:
+        print("[!] No LinkedIn username given. Use -u or set LIUC_USERNAME.")
+        return False
+    if not args.password:
+        # Scripts can't answer a prompt, so only do that on a terminal.
+        if not sys.stdin.isatty():
+            print("[!] No LinkedIn password given. Use -p or set LIUC_PASSWORD.")
+            return False
+        # Prompt in a more secure fashion (not shown on screen).
+        args.password = getpass.getpass()
+
+    session = new_session(args, metrics)
+    # The following are know errors that require the user to log in via the web
+    login_problems = ['challenge', 'captcha', 'manage-account', 'add-email']
+
     # We wll grab an anonymous response to look for the CSRF token, which
     # is required for our logon attempt.
-    anon_response = session.get('https://www.linkedin.com/login')
+    anon_response = session.get(BASE_URL + '/login')
     login_csrf = re.findall(r'name="loginCsrfParam" value="(.*?)"',
                             anon_response.text)
     if login_csrf:
@@ -290,11 +1149,10 @@ def login(args):
         'isJsEnabled': 'false',
         'loginCsrfParam': login_csrf
     }
-    print(auth_payload)
 
     # Perform the actual login. We disable redirects as we will use the 302
     # as an indicator of a successful logon.
-    response = session.post('https://www.linkedin.com/checkpoint/lg/login-submit'
+    response = session.post(BASE_URL + '/checkpoint/lg/login-submit'
                             '?loginSubmitSource=GUEST_HOME',
                             data=auth_payload, allow_redirects=False)
 
@@ -309,7 +1167,7 @@ def login(args):
             return session
         if 'add-phone' in redirect:
             # Skip the prompt to add a phone number
-            url = 'https://www.linkedin.com/checkpoint/post-login/security/dismiss-phone-event'
+            url = BASE_URL + '/checkpoint/post-login/security/dismiss-phone-event'
             response = session.post(url)
             if response.status_code == 200:
                 return session
@@ -343,20 +1201,306 @@ def login(args):
     return False
 
 
-def set_csrf_token(session):
+def set_csrf_token(session, csrf_token=None):
     """Extract the required CSRF token.
 
     Some functions requires a CSRF token equal to the JSESSIONID.
     """
-    csrf_token = session.cookies['JSESSIONID'].replace('"', '')
+    if not csrf_token:
+        csrf_token = session.cookies['JSESSIONID'].replace('"', '')
     session.headers.update({'Csrf-Token': csrf_token})
     return session
 
 
-def get_company_info(name, session) -> (str, int):
+def save_session(session, path, username):
+    """
+    Saves the cookies and CSRF token of a logged in session to path, as JSON.
+
+    These are as good as a password for as long as the session lasts, so the
+    file is created readable by the current user only.
+    """
+    saved = {'username': username,
+             'saved': time.time(),
+             'csrf_token': session.headers.get('Csrf-Token'),
+             'cookies': [{'name': cookie.name, 'value': cookie.value,
+                          'domain': cookie.domain, 'path': cookie.path,
+                          'secure': cookie.secure, 'expires': cookie.expires}
+                         for cookie in session.cookies]}
+
+    # Written to a temporary file first, so a crash never leaves half a session.
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    descriptor = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as outfile:
+        json.dump(saved, outfile)
+    os.replace(tmp_path, path)
+
+
+def load_session(args, metrics=None):
+    """
+    Returns the session saved in args.session_file, if there is one and it
+    still works. Otherwise returns None, and the caller logs in.
+
+    A saved session is only used if it belongs to the same username (when
+    one is given), and the file can't be read by other users. It is checked
+    with a single call to /voyager/api/me before being trusted.
+    """
+    path = args.session_file
+    if not path or not os.path.exists(path):
+        return None
+
+    if os.name == 'posix' and os.stat(path).st_mode & 0o077:
+        print(f"[!] {path} can be read by other users, so it is not used."
+              " Run 'chmod 600' on it, or delete it to log in again.")
+        return None
+
+    try:
+        with open(path, encoding='utf-8') as infile:
+            saved = json.load(infile)
+        cookies = saved['cookies']
+    except (OSError, ValueError, KeyError):
+        print(f"[!] Could not read the saved session in {path}, logging in again.")
+        return None
+
+    if args.username and saved.get('username') != args.username:
+        print(f"[*] The saved session in {path} is for another user, logging in again.")
+        return None
+
+    # Only imported here, like in new_session.
+    from requests.cookies import create_cookie
+
+    session = new_session(args, metrics)
+    for cookie in cookies:
+        session.cookies.set_cookie(create_cookie(**cookie))
+    set_csrf_token(session, saved.get('csrf_token'))
+
+    # The cheapest authenticated call there is. Anything but a 200 means the
+    # session has expired or been revoked.
+    response = session.get(BASE_URL + '/voyager/api/me', allow_redirects=False)
+    if response.status_code != 200:
+        print(f"[*] The saved session in {path} has expired, logging in again.")
+        return None
+
+    args.username = args.username or saved.get('username')
+    return session
+
+
+class CachedResponse:
+    """
+    Stands in for a requests.Response when a reply is served from the cache.
+
+    Only successful replies are ever cached, so the status is always 200.
+    """
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+
+# Eviction trims the cache to this share of its size limit, so the next
+# few pages fit without scanning the whole cache directory again.
+CACHE_LOW_WATER = 0.9
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw voyager API responses.
+
+    Each reply is stored in a file named after a hash of what was asked for
+    (the company name, or the company id, region, keyword and page of a
+    search). Entries older than the TTL are ignored, and the least recently
+    used entries are evicted once the cache grows past its size limit.
+
+    An entry's modification time is when it was written, and is what the
+    TTL goes by. Its access time is when it was last used, for eviction.
+    """
+
+    def __init__(self, cache_dir, ttl=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(cache_dir)
+                               if entry.is_file())
+
+    def _path(self, parts):
+        key = hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, *parts):
+        """Returns a CachedResponse, or None if there is no fresh entry."""
+        path = self._path(parts)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        if self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+            return None
+
+        with open(path, 'rb') as infile:
+            content = infile.read()
+
+        # Mark the entry as used so eviction drops the least recently used
+        # first. The modification time is kept, so it still expires on time.
+        os.utime(path, (time.time(), stat.st_mtime))
+        return CachedResponse(content)
+
+    def put(self, content, *parts):
+        """Stores the raw bytes of a reply."""
+        path = self._path(parts)
+        if os.path.exists(path):
+            self.total_bytes -= os.path.getsize(path)
+
+        # Write to a temporary file first so a crash never leaves a partial entry.
+        with open(path + '.tmp', 'wb') as outfile:
+            outfile.write(content)
+        os.replace(path + '.tmp', path)
+        self.total_bytes += len(content)
+
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes expired entries, then the least recently used ones, until
+        under CACHE_LOW_WATER of the size limit.
+        """
+        entries = sorted((entry.stat().st_atime, entry.stat().st_mtime, entry.stat().st_size,
+                          entry.path)
+                         for entry in os.scandir(self.cache_dir) if entry.is_file())
+        self.total_bytes = sum(size for _, _, size, _ in entries)
+        now = time.time()
+
+        # Entries used lately can still have expired, so those go first.
+        kept = []
+        for entry in entries:
+            if self.ttl is not None and now - entry[1] > self.ttl:
+                os.remove(entry[3])
+                self.total_bytes -= entry[2]
+            else:
+                kept.append(entry)
+
+        low_water = self.max_bytes * CACHE_LOW_WATER
+        for _, _, size, path in kept:
+            if self.total_bytes <= low_water:
+                break
+            os.remove(path)
+            self.total_bytes -= size
+
+
+class RunMetrics:
+    """
+    Records where the time goes during a run.
+
+    Stages (login, company lookup, each search request, parsing, writing,
+    sleeping, ...) are timed with the stage() context manager, and every
+    HTTP call is timed through a requests response hook. write() saves
+    latency summaries and histograms for each, plus some counters, as JSON.
+
+    With a profile directory, each top-level stage is also run under
+    cProfile and saved as a .prof file that pstats or snakeviz can read.
+    """
+    # Upper bounds of the latency histogram buckets, in seconds.
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, profile_dir=None, prefix=''):
+        self.profile_dir = profile_dir
+        self.prefix = prefix
+        self.stages = {}
+        self.http = {}
+        self.counters = {}
+        self.searches = []
+        self.profiling = False
+        self.started = time.time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Times the block as one run of the named stage."""
+        # cProfile can only run one profiler at a time, so nested stages are
+        # covered by the profile of the stage around them.
+        profiler = None
+        if self.profile_dir and not self.profiling:
+            profiler = cProfile.Profile()
+            self.profiling = True
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(name, []).append(time.perf_counter() - start)
+            if profiler:
+                profiler.disable()
+                self.profiling = False
+                profiler.dump_stats(os.path.join(self.profile_dir,
+                                                 f'{self.prefix}{name}.prof'))
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_response(self, response, *args, **kwargs):
+        """requests response hook, recording the latency and size of an HTTP call."""
+        path = urllib.parse.urlsplit(response.url).path
+        endpoint = path.replace('/voyager/api/', '/').strip('/')
+        self.http.setdefault(endpoint, []).append(response.elapsed.total_seconds())
+        self.count('http_requests')
+        self.count('bytes_received', len(response.content))
+        # What actually came over the network, before decompression.
+        if hasattr(response.raw, 'tell'):
+            self.count('bytes_on_wire', response.raw.tell())
+
+    @classmethod
+    def summarize(cls, timings):
+        timings = sorted(timings)
+        histogram = [0] * (len(cls.BUCKETS) + 1)
+        for timing in timings:
+            histogram[bisect.bisect_left(cls.BUCKETS, timing)] += 1
+        labels = [f'<={bucket}s' for bucket in cls.BUCKETS] + [f'>{cls.BUCKETS[-1]}s']
+
+        return {'count': len(timings),
+                'total': sum(timings),
+                'mean': sum(timings) / len(timings),
+                'min': timings[0],
+                'p50': timings[len(timings) // 2],
+                'p95': timings[int(len(timings) * 0.95)],
+                'max': timings[-1],
+                'histogram': dict(zip(labels, histogram))}
+
+    def report(self):
+        """Returns everything recorded as a JSON-friendly dict."""
+        report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                  'wall_seconds': time.time() - self.started,
+                  'stages': {name: self.summarize(timings) for name, timings in self.stages.items()},
+                  'http': {name: self.summarize(timings) for name, timings in self.http.items()},
+                  'counters': dict(self.counters),
+                  'searches': self.searches}
+
+        parse_seconds = sum(self.stages.get('parse', []))
+        if parse_seconds:
+            report['records_parsed_per_second'] = self.counters.get('records_parsed', 0) / parse_seconds
+
+        return report
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as outfile:
+            json.dump(self.report(), outfile, indent=2)
+
+
+def get_company_info(name, session, cache=None) -> (str, int):
     """
     :param name:
     :param session:
+    :param cache:
     :return (str, int):
     """
     """Scrapes basic company info.
@@ -364,13 +1508,26 @@ def get_company_info(name, session) -> (str, int):
     Note that not all companies fill in this info, so exceptions are provided.
     The company name can be found easily by browsing LinkedIn in a web browser,
     searching for the company, and looking at the name in the address bar.
+
+    If a ResponseCache is given, a cached reply is used when there is one.
+    Without a session (--replay), the cached reply is the only option.
     """
     # https://docs.python.org/3/library/urllib.parse.html#urllib.parse.quote_plus
     escaped_name = urllib.parse.quote_plus(name)
 
-    response = session.get(('https://www.linkedin.com'
-                            '/voyager/api/organization/companies?'
-                            'q=universalName&universalName=' + escaped_name))
+    response = cache.get('company', name) if cache else None
+    if response is None:
+        if session is None:
+            print(f"[!] No cached company info for '{name}'. Run once without --replay to fill the cache.")
+            sys.exit()
+        try:
+            response = session.get((BASE_URL +
+                                    '/voyager/api/organization/companies?'
+                                    'q=universalName&universalName=' + escaped_name))
+        except OSError as error:
+            print(f"[!] Yikes, could not reach LinkedIn to get the {escaped_name} company info:")
+            print(f"    {error}")
+            sys.exit(1)
     if response.status_code == 404:
         print(f"[!] Could not find that '{escaped_name}' company name. Please double-check LinkedIn and try again.")
         sys.exit()
@@ -384,7 +1541,7 @@ def get_company_info(name, session) -> (str, int):
     # https://bit.ly/2vGcft0
     # The following bit is a temporary fix until I can figure out a
     # low-maintenance solution that is inclusive of these areas.
-    if 'mwlite' in response.text:
+    if b'mwlite' in response.content:
         print("[!] You are being served the 'lite' version of"
               " LinkedIn (https://bit.ly/2vGcft0) that is not yet supported"
               " by this tool. Please try again using a VPN exiting from USA,"
@@ -393,13 +1550,16 @@ def get_company_info(name, session) -> (str, int):
         sys.exit()
 
     try:
-        response_json = json.loads(response.text)
+        response_json = json_loads(response.content)
     except json.decoder.JSONDecodeError:
         print("[!] Yikes! Could not decode JSON when getting company info! :(")
         print("Here's the first 200 characters of the HTTP reply which may help in debugging:\n\n")
         print(response.text[:200])
         sys.exit()
 
+    if cache and not isinstance(response, CachedResponse):
+        cache.put(response.content, 'company', name)
+
     company = response_json["elements"][0]
 
     found_name = company.get('name', "NOT FOUND")
@@ -431,7 +1591,9 @@ def set_inner_loops(staff_count: int, args):
     exceeded if you use the geoblast or keyword feature.
 
     Loops may stop early if no more matches are found or if a single search
-    exceeds LinkedIn's 1000 non-commercial use limit.
+    exceeds LinkedIn's 1000 non-commercial use limit. This is only an upper
+    bound, as do_loops stops each search at the page count its own results
+    give.
 
     """
 
@@ -490,7 +1652,7 @@ def set_outer_loops(args):
     return outer_loops
 
 
-def get_results(session, company_id, page, region, keyword):
+def get_results(session, company_id, page, region, keyword, cache=None):
     """
     Scrapes raw data for processing.
 
@@ -500,17 +1662,26 @@ def get_results(session, company_id, page, region, keyword):
     The mobile site defaults to using a 'count' of 10, but testing shows that
     25 is allowed. This behavior will appear to the web server as someone
     scrolling quickly through all available results.
+
+    If a ResponseCache is given, a cached page is used when there is one.
+    Without a session (--replay), returns None when the page is not cached.
     """
+    if cache:
+        cached = cache.get('hits', company_id, region, keyword, page)
+        if cached is not None:
+            return cached
+    if session is None:
+        return None
+
     # When using the --geoblast feature, we need to inject our set of region
-    # codes into the search parameter.
-    if region:
-        region = re.sub(':', '%3A', region)  # must URL encode this parameter
+    # codes into the search parameter. The cache is keyed on the unencoded codes.
+    encoded_region = re.sub(':', '%3A', region)  # must URL encode this parameter
 
     # Build the base search URL.
-    url = ('https://www.linkedin.com'
+    url = (BASE_URL +
            '/voyager/api/search/hits'
            f'?facetCurrentCompany=List({company_id})'
-           f'&facetGeoRegion=List({region})'
+           f'&facetGeoRegion=List({encoded_region})'
            f'&keywords=List({keyword})'
            '&q=people&maxFacetValues=15'
            '&supportedFacets=List(GEO_REGION,CURRENT_COMPANY)'
@@ -520,31 +1691,87 @@ def get_results(session, company_id, page, region, keyword):
 
     # Perform the search for this iteration.
     result = session.get(url)
+
+    # Pages that hit the commercial search limit are not worth keeping.
+    if cache and result.status_code == 200 and b'UPSELL_LIMIT' not in result.content:
+        cache.put(result.content, 'hits', company_id, region, keyword, page)
+
     return result
 
 
+class Employee:
+    """
+    One person found in the search results.
+
+    Uses __slots__ instead of a dict per person, and interns the occupation,
+    as the same few job titles repeat across thousands of records. The
+    cleaned and split name parts are stored on the record the first time
+    they are needed (see employee_keys), so a name is only cleaned once.
+    """
+    __slots__ = ('full_name', 'occupation', 'first', 'last', 'middles', 'surnames')
+
+    def __init__(self, full_name, occupation):
+        self.full_name = full_name
+        self.occupation = sys.intern(occupation or '')
+        self.first = None
+        self.last = None
+        self.middles = None
+        self.surnames = None
+
+    def __repr__(self):
+        return f'Employee({self.full_name!r}, {self.occupation!r})'
+
+    def to_dict(self):
+        return {'full_name': self.full_name, 'occupation': self.occupation}
+
+
 def find_employees(result):
     """
-    Takes the Test response of an HTTP query, converts to JSON, and extracts employee details.
+    Takes the raw response of an HTTP query, converts to JSON, and extracts employee details.
 
-    Returns a list of dictionary items, or False if none found.
+    The body can be passed as bytes (result.content), which saves decoding it
+    to text first. Only the few fields we keep are read from each profile.
+
+    Returns a list of Employee records, or False if none found.
     :param result:
     :return:
     """
+    return parse_page(result)[0]
+
+
+def parse_page(result):
+    """
+    Like find_employees, but also returns the paging totals of the search,
+    as (employees, total, reachable).
+
+    total is how many results the search has (metadata.totalResultCount), and
+    reachable how many of those it will page through (paging.total), which
+    LinkedIn caps at 1000. Either is None when the response doesn't say.
+    """
     found_employees = []
 
     try:
-        result_json = json.loads(result)
+        result_json = json_loads(result)
     except json.decoder.JSONDecodeError:
         print("\n[!] Yikes! Could not decode JSON when scraping this loop! :(")
         print("Here's the first 200 characters of the HTTP reply which may help in debugging: \n\n")
+        if isinstance(result, bytes):
+            result = result[:200].decode('utf-8', errors='replace')
         print(result[:200])
-        return False
+        return False, None, None
+
+    # Anything but an object can't be a search result. Raised as TypeError,
+    # like indexing it would, so ingest skips the file as it always has.
+    if not isinstance(result_json, dict):
+        raise TypeError(f'expected a JSON object, got {type(result_json).__name__}')
+
+    reachable = (result_json.get('paging') or {}).get('total')
+    total = (result_json.get('metadata') or {}).get('totalResultCount', reachable)
 
     # When you get to the last page of results, the next page will have an empty
     # "elements" list.
     if not result_json['elements']:
-        return False
+        return False, total, reachable
 
     # The "elements" list is the mini-profile you see when scrolling through a
     # company's employees. It does not have all info on the person, like their
@@ -552,17 +1779,202 @@ def find_employees(result):
     for body in result_json['elements']:
         profile = (body['hitInfo']['com.linkedin.voyager.search.SearchProfile']['miniProfile'])
         full_name = f"{profile['firstName']} {profile['lastName']}"
-        employee = {'full_name': full_name,
-                    'occupation': profile['occupation']}
 
         # Some employee names are not disclosed and return empty. We don't want those.
-        if len(employee['full_name']) > 1:
-            found_employees.append(employee)
+        if len(full_name) > 1:
+            found_employees.append(Employee(full_name, profile['occupation']))
+
+    return found_employees, total, reachable
+
+
+def split_employees(employees):
+    """
+    Cleans and splits the names of a list of employees in one batch, storing
+    the name parts on each employee. Returns the cleaned names.
+    """
+    names = NameMutator.clean_names(employee.full_name for employee in employees)
+    columns = NameMutator.split_names(names)
 
-    return found_employees
+    for employee, first, last, middles, surnames in zip(employees, *columns):
+        # Name parts repeat a lot, so only keep one copy of each. Most people
+        # have no middle names or other surnames, which all share one ().
+        employee.first = sys.intern(first)
+        employee.last = sys.intern(last)
+        employee.middles = tuple(map(sys.intern, middles)) if middles else ()
+        employee.surnames = tuple(map(sys.intern, surnames)) if surnames else ()
 
+    return names
 
-def do_loops(session, company_id, outer_loops, args):
+
+def employee_keys(employees):
+    """
+    Returns the identity keys used to de-duplicate a list of employees.
+
+    The same person is often found under several keywords or regions, with
+    small differences in how their name is written. We treat two records as
+    the same person if their cleaned names and occupations match.
+
+    As the names have to be cleaned anyway, the name parts are stored on
+    each employee too, so they are ready when the usernames are written.
+    Names that clean down to nothing, like CJK or Arabic script or a bare
+    "(PhD)", fall back to the raw name so they don't all look like one person.
+    """
+    names = split_employees(employees)
+    return [(name or employee.full_name.strip().casefold(), employee.occupation)
+            for name, employee in zip(names, employees)]
+
+
+class CrawlJournal:
+    """
+    Append-only checkpoint journal for a crawl, used by --resume.
+
+    The first line records the search being run. After that, one JSON record
+    is appended per completed page holding the new employees it added, and
+    one per outer loop that ran to the end. Reading it back tells us which
+    pages can be skipped and which employees we already have.
+
+    Page records also hold how many results the page had and the totals of
+    its search, so searches carries on with the counts of each outer loop.
+    """
+
+    def __init__(self, path, search):
+        self.path = path
+        self.search = search
+        self.next_pages = {}
+        self.done_loops = set()
+        self.searches = {}
+        self.employees = []
+        self.resumed = False
+        self.outfile = None
+
+    def resume(self):
+        """
+        Loads a previous journal for the same search. Returns False if there
+        is nothing to resume.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        records = []
+        with open(self.path, encoding='utf-8') as infile:
+            for line in infile:
+                try:
+                    records.append(json.loads(line))
+                except json.decoder.JSONDecodeError:
+                    # A crash can leave the last line half written.
+                    continue
+
+        if not records or records[0].get('search') != self.search:
+            return False
+
+        for record in records[1:]:
+            if record.get('done'):
+                self.done_loops.add(record['loop'])
+            else:
+                self.next_pages[record['loop']] = record['page'] + 1
+                self.employees.extend(Employee(**employee) for employee in record['employees'])
+
+                # Journals from before the counts were kept only have the new employees.
+                search = self.searches.setdefault(
+                    record['loop'], {'retrieved': 0, 'total': None, 'reachable': None})
+                search['retrieved'] += record.get('found', len(record['employees']))
+                for key in ('total', 'reachable'):
+                    if record.get(key) is not None:
+                        search[key] = record[key]
+
+        self.resumed = True
+        return True
+
+    def __enter__(self):
+        if self.resumed:
+            self.outfile = open(self.path, 'a', encoding='utf-8')
+            # Start on a fresh line in case the last record was cut short.
+            if self.outfile.tell() and not self._ends_with_newline():
+                self.outfile.write('\n')
+        else:
+            self.outfile = open(self.path, 'w', encoding='utf-8')
+            self._append({'search': self.search})
+        return self
+
+    def __exit__(self, *exc):
+        self.outfile.close()
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as infile:
+            infile.seek(-1, os.SEEK_END)
+            return infile.read(1) == b'\n'
+
+    def _append(self, record):
+        self.outfile.write(json.dumps(record) + '\n')
+        self.outfile.flush()
+
+    def record_page(self, loop, page, employees, found=None, total=None, reachable=None):
+        self._append({'loop': loop, 'page': page, 'found': found, 'total': total,
+                      'reachable': reachable,
+                      'employees': [employee.to_dict() for employee in employees]})
+
+    def record_done(self, loop):
+        self._append({'loop': loop, 'done': True})
+
+
+class PageWorker:
+    """
+    Runs functions one at a time, in the order given, on a background thread.
+
+    This is what --pipeline hands the parsing and writing of each page to,
+    so they happen while the next request is waiting on the network or the
+    --sleep. The queue is bounded, so a worker that falls behind holds up
+    the requests instead of piling up pages in memory.
+
+    submit() returns a Future for the function's result. An exception from
+    any of them is raised again by close().
+    """
+
+    def __init__(self, size=8):
+        self.queue = queue.Queue(size)
+        self.error = None
+        self.thread = threading.Thread(target=self._work, name='page-worker', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _work(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            future, func, args = task
+            # Once one page has failed, the ones after it can't be written in order.
+            if self.error:
+                future.cancel()
+                continue
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(func(*args))
+            except BaseException as error:
+                self.error = error
+                future.set_exception(error)
+
+    def submit(self, func, *args):
+        future = concurrent.futures.Future()
+        self.queue.put((future, func, args))
+        return future
+
+    def close(self):
+        """Waits for everything submitted to finish."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def do_loops(session, company_id, outer_loops, args, writer=None, cache=None, journal=None,
+             metrics=None):
     """
     Performs looping where the actual HTTP requests to scrape names occurs
 
@@ -576,11 +1988,135 @@ def do_loops(session, company_id, outer_loops, args):
     record search limit.
 
     This function will stop searching if a loop returns 0 new names.
+
+    Employees found more than once across loops are only kept once, based on
+    the keys from employee_keys.
+
+    If an OutputWriter (or an EmployeeStore) is passed in, new employees are
+    written out as each page arrives instead of being kept in memory (see
+    --stream and --db), and the returned list will be empty.
+
+    Pages are read from and saved to the ResponseCache, if one is given.
+
+    Completed pages are recorded in the CrawlJournal, if one is given. When
+    it was resumed, the employees it holds are added first, and the pages and
+    loops it has already completed are skipped.
+
+    Requests, parsing, writing and sleeping are timed in the RunMetrics, if
+    one is given.
+
+    With --pipeline, pages are still requested one at a time on the same
+    schedule, but are parsed and written by a PageWorker in the background.
+    Whether a page was the end of the road is only known once it is parsed,
+    so without --sleep to cover for that, the next page is requested
+    regardless and thrown away if it turns out to be past the end.
+
+    Each search stops right after its last page, as worked out from the
+    paging total in its first response, even when the depth guessed from the
+    staff count was less (a depth given with -d is still kept). Otherwise
+    (or if that was wrong), it stops at the first empty page. How many results each search has and how
+    many were retrieved is printed at the end, and saved in the RunMetrics.
     """
+    metrics = metrics or RunMetrics()
     # Crafting the right URL is a bit tricky, so currently unnecessary
     # parameters are still being included but set to empty. You will see this
     # below with geoblast and keywords.
     employee_list = []
+    seen_employees = set()
+    total_names = 0
+
+    # Pages in each search, once known from its paging total, and the totals
+    # to report, by outer loop.
+    page_limits = {}
+    searches = {}
+
+    # Pick up where a previous, interrupted run left off.
+    if journal and journal.resumed:
+        seen_employees.update(employee_keys(journal.employees))
+        if writer:
+            writer.write(journal.employees)
+            writer.flush()
+        else:
+            employee_list.extend(journal.employees)
+        total_names = len(journal.employees)
+        print(f"[*] Resuming with {total_names} names from {journal.path}")
+
+    def add_page(current_loop, page, content):
+        """Parses a page and keeps its new employees. Returns how many it had."""
+        nonlocal total_names
+        new_names = 0
+        duplicate_names = 0
+
+        with metrics.stage('parse'):
+            found_employees, total, reachable = parse_page(content)
+
+        search = searches[current_loop]
+        if total is not None:
+            search['total'] = total
+        if reachable is not None:
+            page_limits[current_loop] = -(-reachable // 25)
+
+        if not found_employees:
+            sys.stdout.write('\n')
+            print("[*] We have hit the end of the road! Moving on...")
+            if journal:
+                journal.record_done(current_loop)
+            return 0
+
+        metrics.count('records_parsed', len(found_employees))
+        search['retrieved'] += len(found_employees)
+        new_employees = []
+        for employee, key in zip(found_employees, employee_keys(found_employees)):
+            if key in seen_employees:
+                duplicate_names += 1
+                continue
+            seen_employees.add(key)
+            new_employees.append(employee)
+            new_names += 1
+
+        # In streaming mode the page goes straight to disk.
+        if writer:
+            with metrics.stage('write'):
+                writer.write(new_employees)
+                writer.flush()
+        else:
+            employee_list.extend(new_employees)
+        total_names += new_names
+        metrics.count('duplicates', duplicate_names)
+
+        if journal:
+            journal.record_page(current_loop, page, new_employees, len(found_employees),
+                                total, reachable)
+
+        if args.pipeline:
+            sys.stdout.write(f"[*] Scraped results on loop {str(page + 1)}.    ")
+        sys.stdout.write(f"    [*] Added {str(new_names)} new names, "
+                         f"{str(duplicate_names)} duplicates. "
+                         f"Running total: {str(total_names)}"
+                         "              \r")
+        return len(found_employees)
+
+    def record_done(current_loop):
+        # Pipelined pages may still be on their way to the journal.
+        if journal and worker:
+            worker.submit(journal.record_done, current_loop)
+        elif journal:
+            journal.record_done(current_loop)
+
+    def past_last_page(current_loop, page):
+        # The paging total is exact, so it replaces the guess from the staff
+        # count. Only a depth given with -d is kept as a limit.
+        last_page = page_limits.get(current_loop, args.depth)
+        if args.depth_given:
+            last_page = min(last_page, args.depth)
+        if page < last_page:
+            return False
+        sys.stdout.write('\n')
+        print("[*] That was the last page of results for this search. Moving on...")
+        record_done(current_loop)
+        return True
+
+    worker = PageWorker() if args.pipeline else None
 
     # We want to be able to break here with Ctrl-C and still write the names we have
     try:
@@ -597,15 +2133,53 @@ def do_loops(session, company_id, outer_loops, args):
             else:
                 current_region = ''
                 current_keyword = ''
+            # A resumed search carries on with the counts of the pages it already has.
+            resumed = journal.searches.get(current_loop, {}) if journal else {}
+            searches[current_loop] = {'search': current_region or current_keyword or 'all',
+                                      'total': resumed.get('total'),
+                                      'retrieved': resumed.get('retrieved', 0)}
+            if resumed.get('reachable') is not None:
+                page_limits[current_loop] = -(-resumed['reachable'] // 25)
+
+            start_page = 0
+            if journal:
+                if current_loop in journal.done_loops:
+                    print("[*] Already finished in a previous run. Moving on...")
+                    continue
+                start_page = journal.next_pages.get(current_loop, 0)
+
+            # The worker's result for the page before, when pipelining.
+            pending = None
+
+            # This is the inner loop. It will search results 25 at a time, until
+            # past_last_page says that was the last one.
+            for page in itertools.count(start_page):
+                # No need to request another page if the last one was already
+                # empty, or the search said it has no more.
+                if pending and pending.done() and not pending.result():
+                    break
+                if past_last_page(current_loop, page):
+                    break
 
-            # This is the inner loop. It will search results 25 at a time.
-            for page in range(0, args.depth):
-                new_names = 0
+                if not worker:
+                    sys.stdout.flush()
+                    # Standard output
+                    sys.stdout.write(f"[*] Scraping results on loop {str(page + 1)}...    ")
+                # requests' errors are OSErrors, and by now the retries are used up.
+                try:
+                    with metrics.stage('request'):
+                        result = get_results(session, company_id, page, current_region,
+                                             current_keyword, cache)
+                except OSError as error:
+                    print(f"\n[!] Yikes, the request failed after retrying: {error}")
+                    print("Bailing from loops, but you should troubleshoot.")
+                    break
 
-                sys.stdout.flush()
-                # Standard output
-                sys.stdout.write(f"[*] Scraping results on loop {str(page + 1)}...    ")
-                result = get_results(session, company_id, page, current_region, current_keyword)
+                # When replaying, a page missing from the cache is the end of what we have.
+                if result is None:
+                    sys.stdout.write('\n')
+                    print("[*] No more cached results for this search. Moving on...")
+                    break
 
                 if result.status_code != 200:
                     print(f"\n[!] Yikes, got an HTTP {result.status_code}. This is not normal")
@@ -613,55 +2187,221 @@ def do_loops(session, company_id, outer_loops, args):
                     break
 
                 # Commercial Search Limit might be triggered
-                if "UPSELL_LIMIT" in result.text:
+                if b"UPSELL_LIMIT" in result.content:
                     sys.stdout.write('\n')
                     print("[!] You've hit the commercial search limit! "
                           "Try again on the 1st of the month. Sorry. :(")
                     break
 
-                found_employees = find_employees(result.text)
-
-                if not found_employees:
-                    sys.stdout.write('\n')
-                    print("[*] We have hit the end of the road! Moving on...")
+                if isinstance(result, CachedResponse):
+                    metrics.count('cache_hits')
+
+                if worker:
+                    # If the page before was the end of the road, this one is past it.
+                    if pending and not pending.result():
+                        break
+                    if past_last_page(current_loop, page):
+                        break
+                    pending = worker.submit(add_page, current_loop, page, result.content)
+                elif not add_page(current_loop, page, result.content):
                     break
 
-                new_names += len(found_employees)
-                employee_list.extend(found_employees)
-
-                sys.stdout.write(f"    [*] Added {str(new_names)} new names. "
-                                 f"Running total: {str(len(employee_list))}"
-                                 "              \r")
-
                 # If the user has defined a sleep between loops, we take a little
-                # nap here.
-                time.sleep(args.sleep)
+                # nap here. Cached pages didn't touch the network, so no need.
+                if not isinstance(result, CachedResponse) and args.sleep:
+                    with metrics.stage('sleep'):
+                        time.sleep(args.sleep)
     except KeyboardInterrupt:
         print("\n\n[!] Caught Ctrl-C. Breaking loops and writing files")
+    finally:
+        # Pages already fetched are still parsed and written.
+        if worker:
+            with metrics.stage('drain'):
+                worker.close()
+
+    # Searches that return fewer than they have are worth splitting up further.
+    if searches:
+        print("\n\n[*] Results retrieved for each search:")
+        for search in searches.values():
+            total = '?' if search['total'] is None else search['total']
+            print(f"    {search['search']:<40} {search['retrieved']:6d} of {total}")
+        metrics.searches.extend(searches.values())
+
+    if metrics.counters.get('http_retries'):
+        print(f"[*] Retried {metrics.counters['http_retries']} requests, waiting"
+              f" {metrics.counters['http_retry_wait_seconds']:.1f} seconds in all.")
 
     return employee_list
 
 
-def write_lines(employees, name_func, domain, outfile):
+def write_lines(employees, domain, formats, outfiles):
     """
-    Helper function to mutate names and write to an outfile
-
+    Helper function to mutate names and write to a set of outfiles
 
-    Needs to be called with a string variable in name_func that matches the class method
-    name in the NameMutator class
+    Names that weren't split yet are cleaned and split in one batch, and
+    every username format is written out from that single split. formats
+    and outfiles map each format's name to its UsernameTemplate and open file.
     :param employees:
-    :param name_func:
     :param domain:
-    :param outfile:
+    :param formats:
+    :param outfiles:
     :return:
     """
+    split_employees([employee for employee in employees if employee.first is None])
     for employee in employees:
-        mutator = NameMutator(employee["full_name"])
-        for name in getattr(mutator, name_func)():
-            outfile.write(name + domain + '\n')
+        first, last = employee.first, employee.last
+        middles, surnames = employee.middles, employee.surnames
+        for format_name, outfile in outfiles.items():
+            for name in formats[format_name](first, last, middles, surnames):
+                outfile.write(name + domain + '\n')
+
+
+# Where the output goes (see --sink), and the extension of the files for
+# each sink that writes files. jsonl writes to stdout instead.
+SINKS = ('files', 'gzip', 'zstd', 'jsonl')
+SINK_SUFFIXES = {'files': '.txt', 'gzip': '.txt.gz', 'zstd': '.txt.zst'}
+
+
+def jsonl_record(employee, usernames, domain):
+    """Formats one person as a line of the jsonl sink."""
+    record = {'name': employee.full_name, 'occupation': employee.occupation,
+              'usernames': {format_name: [name + domain for name in names]
+                            for format_name, names in usernames.items()}}
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def open_sink_file(path, sink, mode='w'):
+    """Opens an output file of the given sink as text, for writing ('w') or reading ('r')."""
+    if sink == 'gzip':
+        # Level 6 is most of the size win of 9, at a fraction of the time.
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    if sink == 'zstd':
+        # zstandard is optional, and only imported when asked for.
+        import zstandard
+
+        if mode == 'w':
+            raw = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'),
+                                                                  closefd=True)
+        else:
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(raw, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
 
 
-def write_files(company, domain, employees, out_dir):
+class OutputWriter:
+    """
+    Keeps every output file open so employees can be written as they are found.
+
+    Used as a context manager. Files are opened once with normal buffering,
+    and flush() pushes whatever has been written so far to disk, so partial
+    results survive a crash.
+
+    The sink picks how: plain .txt files, the same compressed with gzip or
+    zstd, or no files at all and one JSON line per person on stdout, holding
+    their name, occupation and every username. The records go to records
+    when given, as main() points sys.stdout at stderr while they are written.
+    """
+
+    def __init__(self, company, domain, out_dir, formats=None, names=True, sink='files',
+                 records=None):
+        self.company = company
+        self.domain = domain
+        self.out_dir = out_dir
+        self.formats = formats or BUILTIN_FORMATS
+        self.names = names
+        self.sink = sink
+        self.records = records
+        self.stream = None
+        self.stack = contextlib.ExitStack()
+        self.raw_file = None
+        self.meta_file = None
+        self.meta_csv = None
+        self.outfiles = {}
+
+    def __enter__(self):
+        if self.sink == 'jsonl':
+            self.stream = self.records or sys.stdout
+            return self
+
+        # Check for and create an output directory to store the files.
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+
+        # The raw names and meta-data can be left out, for when the input
+        # is itself an earlier raw-names file.
+        if self.names:
+            self.raw_file = self._open('raw-names')
+            self.meta_file = self._open('meta-data')
+            # Occupations are full of commas, so this has to be real CSV.
+            self.meta_csv = csv.writer(self.meta_file, lineterminator='\n')
+            self.meta_csv.writerow(('full_name', 'occupation'))
+        for format_name in self.formats:
+            self.outfiles[format_name] = self._open(format_name)
+
+        return self
+
+    def __exit__(self, *exc):
+        self.stack.close()
+
+    def _open(self, suffix):
+        path = f'{self.out_dir}/{self.company}-{suffix}{SINK_SUFFIXES[self.sink]}'
+        return self.stack.enter_context(open_sink_file(path, self.sink))
+
+    def write(self, employees):
+        """Writes the raw names, meta-data and every username format."""
+        if self.stream:
+            for employee, usernames in zip(employees, mutate_employees(employees, self.formats)):
+                self.write_mutated(employee, usernames)
+            return
+
+        if self.names:
+            for employee in employees:
+                self.raw_file.write(employee.full_name + '\n')
+                self.meta_csv.writerow((employee.full_name, employee.occupation))
+
+        write_lines(employees, self.domain, self.formats, self.outfiles)
+
+    def write_mutated(self, employee, usernames):
+        """
+        Writes one employee whose usernames were already generated, as a
+        dict of format name to usernames (see mutate_employees).
+        """
+        if self.stream:
+            self.stream.write(jsonl_record(employee, usernames, self.domain))
+            return
+
+        if self.names:
+            self.raw_file.write(employee.full_name + '\n')
+            self.meta_csv.writerow((employee.full_name, employee.occupation))
+
+        for format_name, names in usernames.items():
+            outfile = self.outfiles[format_name]
+            for name in names:
+                outfile.write(name + self.domain + '\n')
+
+    def write_blocks(self, blocks):
+        """
+        Writes text a worker already formatted, as a dict of format name to
+        the lines for that file, or of 'jsonl' to the records (see mutate_chunk).
+        """
+        if self.stream:
+            self.stream.write(blocks['jsonl'])
+            return
+        for format_name, text in blocks.items():
+            self.outfiles[format_name].write(text)
+
+    def flush(self):
+        if self.stream:
+            self.stream.flush()
+        for outfile in self.outfiles.values():
+            outfile.flush()
+        if self.names:
+            self.raw_file.flush()
+            self.meta_file.flush()
+
+
+def write_files(company, domain, employees, out_dir, formats=None, sink='files',
+                records=None):
     """Writes data to various formatted output files.
 
     After scraping and processing is complete, this function formats the raw
@@ -670,73 +2410,783 @@ def write_files(company, domain, employees, out_dir):
 
     See in-line comments for decisions made on handling special cases.
     """
+    # All the output files are written in a single pass over the
+    # employees, so every name is only mutated once.
+    with OutputWriter(company, domain, out_dir, formats, sink=sink, records=records) as writer:
+        writer.write(employees)
 
-    # Check for and create an output directory to store the files.
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir)
 
-    # Write out all the raw and mutated names to files
-    with open(f'{out_dir}/{company}-raw-names.txt', 'w', encoding='utf-8') as outfile:
-        for employee in employees:
-            outfile.write(employee['full_name'] + '\n')
+# Most spilled runs merged at once, each holding a file open.
+MERGE_FAN_IN = 64
+
+
+def _spill(lines, directory, runs):
+    # Sorted runs are written with newlines kept, ready for heapq.merge.
+    path = f'{directory}/run-{len(runs)}.txt'
+    with open(path, 'w', encoding='utf-8') as outfile:
+        outfile.writelines(sorted(lines))
+    runs.append(path)
+
+
+def _merge_runs(run_paths, path):
+    # Merges sorted runs into a new one, dropping repeats, and deletes them.
+    with contextlib.ExitStack() as stack:
+        infiles = [stack.enter_context(open(run_path, encoding='utf-8'))
+                   for run_path in run_paths]
+        with open(path, 'w', encoding='utf-8') as outfile:
+            outfile.writelines(line for line, _ in itertools.groupby(heapq.merge(*infiles)))
+    for run_path in run_paths:
+        os.remove(run_path)
+
+
+def finalize_file(path, sort=False, max_memory=256, sink='files'):
+    """
+    De-duplicates, and optionally sorts, the lines of a file in place.
+
+    Lines are kept in a hash set while it stays under roughly max_memory MB,
+    and unsorted output keeps each line where it first appeared. Past that,
+    sorted runs are spilled next to the file and merged back, so the output
+    comes out sorted either way. When there are more than MERGE_FAN_IN runs,
+    they are first merged in passes of that many, so the open files stay
+    bounded however small max_memory is. Compressed files are read and rewritten
+    with the same sink. Returns (lines read, lines written).
+    """
+    max_bytes = max_memory * 1024 * 1024
+    directory = os.path.dirname(path) or '.'
+    read = written = 0
+
+    with tempfile.TemporaryDirectory(dir=directory, prefix='.finalize-') as work_dir:
+        runs = []
+        seen = {}
+        size = 0
+        with open_sink_file(path, sink, 'r') as infile:
+            for line in infile:
+                read += 1
+                if not line.endswith('\n'):
+                    line += '\n'
+                if line in seen:
+                    continue
+                seen[line] = None
+                # A string plus its share of the dict, near enough.
+                size += sys.getsizeof(line) + 64
+                if size > max_bytes:
+                    _spill(seen, work_dir, runs)
+                    seen, size = {}, 0
+
+        if runs:
+            if seen:
+                _spill(seen, work_dir, runs)
+            seen = None
+
+            merge_pass = 0
+            while len(runs) > MERGE_FAN_IN:
+                merged = []
+                for start in range(0, len(runs), MERGE_FAN_IN):
+                    group = runs[start:start + MERGE_FAN_IN]
+                    if len(group) == 1:
+                        merged.append(group[0])
+                        continue
+                    merged_path = f'{work_dir}/merge-{merge_pass}-{len(merged)}.txt'
+                    _merge_runs(group, merged_path)
+                    merged.append(merged_path)
+                runs = merged
+                merge_pass += 1
+
+            infiles = [open(run_path, encoding='utf-8') for run_path in runs]
+            lines = (line for line, _ in itertools.groupby(heapq.merge(*infiles)))
+        else:
+            infiles = []
+            lines = sorted(seen) if sort else seen
+
+        # The file is only replaced once the new one is complete.
+        tmp_path = f'{work_dir}/final{SINK_SUFFIXES[sink]}'
+        try:
+            with open_sink_file(tmp_path, sink) as outfile:
+                for line in lines:
+                    outfile.write(line)
+                    written += 1
+        finally:
+            for infile in infiles:
+                infile.close()
+        os.replace(tmp_path, path)
+
+    return read, written
+
 
-    with open(f'{out_dir}/{company}-meta-data.txt', 'w', encoding='utf-8') as outfile:
-        outfile.write('full_name,occupation\n')
+def finalize_files(company, out_dir, formats, sort=False, max_memory=256, sink='files'):
+    """
+    Runs finalize_file over every username format file written for company.
+
+    The raw-names and meta-data files are left alone, as each line in those
+    is a different person.
+    """
+    for format_name in formats:
+        path = f'{out_dir}/{company}-{format_name}{SINK_SUFFIXES[sink]}'
+        if not os.path.exists(path):
+            continue
+        read, written = finalize_file(path, sort, max_memory, sink)
+        print(f"[*] {path}: {written} of {read} usernames are unique")
+
+
+class EmployeeStore:
+    """
+    Optional SQLite store of every employee found for a company, across runs.
+
+    Each run is numbered. Employees are upserted, keeping when they were first
+    and last seen, and only people that are new to the store get their
+    usernames generated and saved. The output files can then be exported from
+    the store, either in full or just what was added since a given run.
+
+    Once start_run() has been called, the store can stand in for an
+    OutputWriter in do_loops, as it has the same write() and flush().
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS companies (
+            id TEXT PRIMARY KEY,
+            universal_name TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS companies_name ON companies (universal_name);
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            company_id TEXT NOT NULL,
+            started_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS formats (
+            company_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            template TEXT NOT NULL,
+            PRIMARY KEY (company_id, name));
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY,
+            company_id TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            occupation TEXT NOT NULL,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            first_run INTEGER NOT NULL,
+            last_run INTEGER NOT NULL,
+            UNIQUE (company_id, full_name, occupation));
+        CREATE INDEX IF NOT EXISTS employees_name ON employees (full_name);
+        CREATE TABLE IF NOT EXISTS usernames (
+            employee_id INTEGER NOT NULL REFERENCES employees (id),
+            format TEXT NOT NULL,
+            username TEXT NOT NULL,
+            run_id INTEGER NOT NULL,
+            PRIMARY KEY (employee_id, format, username));
+        CREATE INDEX IF NOT EXISTS usernames_run ON usernames (run_id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS occupations USING fts5 (
+            occupation, content='employees', content_rowid='id');
+    """
+
+    def __init__(self, path):
+        # With --pipeline, the store is written to from the PageWorker thread,
+        # though never from two threads at once.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        indexed = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'occupations'").fetchone()
+        self.connection.executescript(self.SCHEMA)
+        # Stores from before the occupation index get it built once.
+        if not indexed:
+            self.connection.execute("INSERT INTO occupations (occupations) VALUES ('rebuild')")
+            self.connection.commit()
+        self.run_id = None
+        self.company_id = None
+        self.formats = None
+        self.new_employees = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.connection.commit()
+        self.connection.close()
+
+    def start_run(self, company_id, universal_name, formats):
+        """
+        Starts a new numbered run for a company and returns its number.
+
+        Usernames are generated for every employee already in the store for
+        any format that is new, or whose template changed, since they were
+        last saved.
+        """
+        self.company_id = company_id
+        # Everything is saved, and --exclude is only applied when exporting.
+        self.formats = {name: UsernameTemplate(template.template, limit=template.limit)
+                        for name, template in formats.items()}
+        self.connection.execute('INSERT OR REPLACE INTO companies VALUES (?, ?)',
+                                (company_id, universal_name))
+        self.run_id = self.connection.execute(
+            'INSERT INTO runs (company_id, started_at) VALUES (?, ?)',
+            (company_id, time.time())).lastrowid
+
+        saved = dict(self.connection.execute(
+            'SELECT name, template FROM formats WHERE company_id = ?', (company_id,)))
+        # Stores saved before --max-variants only have the template, so they
+        # are backfilled once with the usernames of the other surnames too.
+        for format_name, template in self.formats.items():
+            if saved.get(format_name) != template.key:
+                self._backfill(format_name, template)
+
+        self.connection.commit()
+        return self.run_id
+
+    def _backfill(self, format_name, template):
+        self.connection.execute(
+            'DELETE FROM usernames WHERE format = ? AND employee_id IN'
+            ' (SELECT id FROM employees WHERE company_id = ?)', (format_name, self.company_id))
+
+        rows = self.connection.execute(
+            'SELECT id, full_name, occupation FROM employees WHERE company_id = ?',
+            (self.company_id,)).fetchall()
+        employees = [Employee(full_name, occupation) for _, full_name, occupation in rows]
+        split_employees(employees)
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO usernames VALUES (?, ?, ?, ?)',
+            ((employee_id, format_name, username, self.run_id)
+             for (employee_id, _, _), employee in zip(rows, employees)
+             for username in template(employee.first, employee.last, employee.middles,
+                                      employee.surnames)))
+
+        self.connection.execute('INSERT OR REPLACE INTO formats VALUES (?, ?, ?)',
+                                (self.company_id, format_name, template.key))
+
+    def write(self, employees):
+        """
+        Upserts employees into the current run, and saves the usernames of
+        the ones that are new to the store.
+        """
+        now = time.time()
+        new_employees = []
         for employee in employees:
-            outfile.write(employee['full_name'] + '.' + employee['occupation'] + '\n')
+            employee_id, first_run = self.connection.execute(
+                'INSERT INTO employees (company_id, full_name, occupation, first_seen,'
+                ' last_seen, first_run, last_run) VALUES (?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (company_id, full_name, occupation) DO UPDATE'
+                ' SET last_seen = excluded.last_seen, last_run = excluded.last_run'
+                ' RETURNING id, first_run',
+                (self.company_id, employee.full_name, employee.occupation, now, now,
+                 self.run_id, self.run_id)).fetchone()
+            if first_run == self.run_id:
+                new_employees.append((employee_id, employee))
+
+        # Occupations never change for an employee id, so only new ones are indexed.
+        self.connection.executemany(
+            'INSERT INTO occupations (rowid, occupation) VALUES (?, ?)',
+            ((employee_id, employee.occupation) for employee_id, employee in new_employees))
+
+        split_employees([employee for _, employee in new_employees if employee.first is None])
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO usernames VALUES (?, ?, ?, ?)',
+            ((employee_id, format_name, username, self.run_id)
+             for employee_id, employee in new_employees
+             for format_name, template in self.formats.items()
+             for username in template(employee.first, employee.last, employee.middles,
+                                      employee.surnames)))
+        self.new_employees += len(new_employees)
+
+    def flush(self):
+        self.connection.commit()
+
+    def find_company(self, universal_name):
+        """Returns the company id saved for a company name, or None."""
+        row = self.connection.execute('SELECT id FROM companies WHERE universal_name = ?',
+                                      (universal_name,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, company_id, terms):
+        """
+        Returns the employees whose occupation matches any of the terms, from
+        the full-text index, in the order they were first found.
 
-    with open(f'{out_dir}/{company}-flast.txt', 'w', encoding='utf-8') as outfile:
-        write_lines(employees, 'f_last', domain, outfile)
+        Each term is matched as a phrase, case-insensitively, so "help desk"
+        needs both words together. A term ending in * matches as a prefix,
+        so "engineer*" also finds engineering.
+        """
+        phrases = []
+        for term in terms:
+            prefix = term.endswith('*')
+            phrase = '"' + term.rstrip('*').replace('"', '""') + '"'
+            phrases.append(phrase + '*' if prefix else phrase)
+
+        rows = self.connection.execute(
+            'SELECT e.full_name, e.occupation FROM occupations o'
+            ' JOIN employees e ON e.id = o.rowid'
+            ' WHERE occupations MATCH ? AND e.company_id = ? ORDER BY e.id',
+            (' OR '.join(phrases), company_id))
+        return [Employee(full_name, occupation) for full_name, occupation in rows]
+
+    def export(self, company_id, company, domain, out_dir, formats, since=0, sink='files',
+               records=None):
+        """
+        Writes the usual output files from the store, named after company.
 
-    with open(f'{out_dir}/{company}-f.last.txt', 'w', encoding='utf-8') as outfile:
-        write_lines(employees, 'f_dot_last', domain, outfile)
+        With since, only the usernames saved after that run are written.
+        Usernames in the formats' exclude filters are left out here, as the
+        store keeps them all.
+        """
+        # Usernames come back grouped by employee, which is how they are written.
+        # Each person's usernames for a format are always inserted together,
+        # most likely first, so the rowid keeps that order.
+        placeholders = ', '.join('?' * len(formats))
+        rows = self.connection.execute(
+            'SELECT e.id, e.full_name, e.occupation, u.format, u.username'
+            ' FROM usernames u JOIN employees e ON e.id = u.employee_id'
+            f' WHERE e.company_id = ? AND u.run_id > ? AND u.format IN ({placeholders})'
+            ' ORDER BY e.id, u.format, u.rowid',
+            (company_id, since, *formats))
+
+        total_names = 0
+        with OutputWriter(company, domain, out_dir, formats, sink=sink,
+                          records=records) as writer:
+            current_id, employee, usernames = None, None, {}
+            for employee_id, full_name, occupation, format_name, username in rows:
+                if employee_id != current_id:
+                    if employee:
+                        writer.write_mutated(employee, usernames)
+                        total_names += 1
+                    current_id, employee, usernames = employee_id, Employee(full_name, occupation), {}
+                exclude = formats[format_name].exclude
+                if exclude and any(username in bloom for bloom in exclude):
+                    continue
+                usernames.setdefault(format_name, []).append(username)
+            if employee:
+                writer.write_mutated(employee, usernames)
+                total_names += 1
+
+        return total_names
+
+
+def read_saved_pages(path):
+    """
+    Yields the raw bodies of saved /voyager/api/search/hits responses.
 
-    with open(f'{out_dir}/{company}-first_l.txt', 'w', encoding='utf-8') as outfile:
-        write_lines(employees, 'first_l', domain, outfile)
+    A HAR file can hold many responses, and only the search ones are used.
+    Any other file is expected to hold a single response body.
+    """
+    with open(path, 'rb') as infile:
+        data = infile.read()
+
+    if not path.lower().endswith('.har'):
+        yield data
+        return
+
+    for entry in json_loads(data)['log']['entries']:
+        if '/voyager/api/search/hits' not in entry['request']['url']:
+            continue
+        content = entry['response'].get('content', {})
+        if not content.get('text'):
+            continue
+        if content.get('encoding') == 'base64':
+            yield base64.b64decode(content['text'])
+        else:
+            yield content['text'].encode('utf-8')
 
-    with open(f'{out_dir}/{company}-first.last.txt', 'w', encoding='utf-8') as outfile:
-        write_lines(employees, 'first_dot_last', domain, outfile)
 
-    with open(f'{out_dir}/{company}-first.txt', 'w', encoding='utf-8') as outfile:
-        write_lines(employees, 'first', domain, outfile)
+def mutate_employees(employees, formats):
+    """
+    Generates every username format for a list of employees.
 
-    with open(f'{out_dir}/{company}-last_f.txt', 'w', encoding='utf-8') as outfile:
-        write_lines(employees, 'last_f', domain, outfile)
+    Returns a list of dicts of format name to usernames, in the same order
+    as the employees.
+    """
+    split_employees([employee for employee in employees if employee.first is None])
+    mutated = []
+    for employee in employees:
+        first, last = employee.first, employee.last
+        middles, surnames = employee.middles, employee.surnames
+        mutated.append({format_name: template(first, last, middles, surnames)
+                        for format_name, template in formats.items()})
+    return mutated
 
 
-def main():
-    """Main Function"""
-    print("-" * 50)
-    print("Let's access the username of a company")
-    YourEmail = input("Enter your LinkedIn ID: ")
-    CompanyName = input("default is 'wilson-security'\nEnter Company LinkedIn URL Name: ")
-    args = parse_arguments(YourEmail, CompanyName)
-
-    # Instantiate a session by login in to LinkedIn
-    session = login(args)
-    # If we can't get a valid session, we quit now. Specific errors are
-    # printed to the console inside the login() function.
-    if not session:
-        print("Good byy :(")
-        sys.exit()  # Good byy :(
-
-    print("[*] Successfully logged in.")
+def ingest_file(path, formats):
+    """
+    Process pool worker for ingest_saved_pages.
+
+    Parses every saved response in one file and mutates the employees found.
+    Returns a list of (employee, key, usernames) tuples, with the key from
+    employee_keys.
+    """
+    employees = []
+    for content in read_saved_pages(path):
+        try:
+            found_employees = find_employees(content)
+        except (KeyError, TypeError):
+            print(f"[!] Skipping a response in {path}, it does not look like a search result.")
+            continue
+        if found_employees:
+            employees.extend(found_employees)
+
+    keys = employee_keys(employees)
+    return list(zip(employees, keys, mutate_employees(employees, formats)))
+
+
+def ingest_saved_pages(path, company, domain, out_dir, workers=None, formats=None,
+                       sink='files', records=None):
+    """
+    Builds the output files from saved search responses, with no login.
+
+    Takes a directory of saved /voyager/api/search/hits responses, or a single
+    response or HAR file. Files are parsed and mutated across a process pool,
+    and the results are merged back in file name order, skipping employees
+    that were already found in an earlier file.
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if os.path.isfile(os.path.join(path, name)))
+    else:
+        paths = [path]
+
+    workers = workers or os.cpu_count() or 1
+    print(f"[*] Ingesting {len(paths)} saved files from {path} with {workers} workers")
+
+    seen_employees = set()
+    total_names = 0
+    duplicate_names = 0
+
+    # Small files are handed to the workers in batches to keep the overhead down.
+    chunksize = max(1, len(paths) // (workers * 4))
+    formats = formats or BUILTIN_FORMATS
+    worker = functools.partial(ingest_file, formats=formats)
+    with OutputWriter(company, domain, out_dir, formats, sink=sink, records=records) as writer, \
+            concurrent.futures.ProcessPoolExecutor(
+                workers, initializer=add_transliteration,
+                initargs=(TRANSLITERATIONS.get('custom', {}),)) as executor:
+        for results in executor.map(worker, paths, chunksize=chunksize):
+            for employee, key, usernames in results:
+                if key in seen_employees:
+                    duplicate_names += 1
+                    continue
+                seen_employees.add(key)
+                writer.write_mutated(employee, usernames)
+                total_names += 1
+
+    print(f"[*] Added {total_names} new names, {duplicate_names} duplicates.")
+
+
+# Bytes of a name list each mutate worker takes at a time. Big enough that
+# the per-task overhead disappears, small enough to keep every core busy.
+MUTATE_CHUNK_SIZE = 4 * 1024 * 1024
+
+# What each mutate worker process needs, set once by init_mutate_worker so
+# the formats (and any --exclude filters in them) aren't sent with every chunk.
+MUTATE_WORKER = {}
+
+
+def name_list_chunks(path, chunk_size=MUTATE_CHUNK_SIZE):
+    """
+    Splits a name list into (path, start, end) byte ranges of about
+    chunk_size, each ending at a line break. The file is memory-mapped, so
+    only the pages around each break are read.
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    chunks = []
+    with open(path, 'rb') as infile, \
+            mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        start = 0
+        while start < size:
+            end = mapped.find(b'\n', min(start + chunk_size, size) - 1)
+            end = size if end == -1 else end + 1
+            chunks.append((path, start, end))
+            start = end
+    return chunks
+
+
+def init_mutate_worker(custom, formats, domain, stream):
+    """Process pool initializer for mutate_chunk."""
+    add_transliteration(custom)
+    MUTATE_WORKER.update(formats=formats, domain=domain, stream=stream)
+
+
+def mutate_chunk(chunk):
+    """
+    Process pool worker for mutate_name_files.
+
+    Mutates the names in one (path, start, end) chunk of a name list, read
+    through a memory map. Returns the number of names and the output as
+    text, ready for OutputWriter.write_blocks.
+    """
+    path, start, end = chunk
+    formats, domain = MUTATE_WORKER['formats'], MUTATE_WORKER['domain']
+    with open(path, 'rb') as infile, \
+            mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        text = mapped[start:end].decode('utf-8')
+
+    employees = [Employee(name, '') for name in map(str.strip, text.split('\n')) if name]
+    mutated = mutate_employees(employees, formats)
+    if MUTATE_WORKER['stream']:
+        return len(employees), {'jsonl': ''.join(
+            jsonl_record(employee, usernames, domain)
+            for employee, usernames in zip(employees, mutated))}
+
+    blocks = {}
+    for format_name in formats:
+        blocks[format_name] = ''.join(name + domain + '\n' for usernames in mutated
+                                      for name in usernames[format_name])
+    return len(employees), blocks
+
+
+def mutate_name_files(paths, company, domain, out_dir, formats=None, batch_size=10000,
+                      sink='files', workers=None, records=None):
+    """
+    Writes the username files for lists of full names, one per line.
+
+    Names are read and mutated in batches, so the lists never need to fit in
+    memory. The raw-names and meta-data files are not written, as the input
+    is often the raw-names file of an earlier run.
+
+    Lists bigger than one chunk are memory-mapped and split into line-aligned
+    chunks (see name_list_chunks), mutated across a process pool and written
+    back in input order. Pipes, and everything with a single worker, are
+    read in batches on this process instead.
+    """
+    formats = formats or BUILTIN_FORMATS
+    workers = workers or os.cpu_count() or 1
+    total_names = 0
+    with contextlib.ExitStack() as stack:
+        writer = stack.enter_context(
+            OutputWriter(company, domain, out_dir, formats, names=False, sink=sink,
+                         records=records))
+        executor = None
+        for path in paths:
+            if workers > 1 and os.path.isfile(path) \
+                    and os.path.getsize(path) > MUTATE_CHUNK_SIZE:
+                if executor is None:
+                    print(f"[*] Mutating with {workers} workers")
+                    executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(
+                        workers, initializer=init_mutate_worker,
+                        initargs=(TRANSLITERATIONS.get('custom', {}), formats, writer.domain,
+                                  writer.stream is not None)))
+
+                # A few chunks per worker are in flight at a time, so finished
+                # output never piles up waiting for a slow chunk.
+                pending = collections.deque()
+                for chunk in name_list_chunks(path):
+                    pending.append(executor.submit(mutate_chunk, chunk))
+                    if len(pending) >= workers * 2:
+                        count, blocks = pending.popleft().result()
+                        writer.write_blocks(blocks)
+                        total_names += count
+                while pending:
+                    count, blocks = pending.popleft().result()
+                    writer.write_blocks(blocks)
+                    total_names += count
+                continue
+
+            batch = []
+            with open(path, encoding='utf-8') as infile:
+                for line in infile:
+                    name = line.strip()
+                    if name:
+                        batch.append(Employee(name, ''))
+                    if len(batch) >= batch_size:
+                        writer.write(batch)
+                        total_names += len(batch)
+                        batch = []
+            writer.write(batch)
+            total_names += len(batch)
+
+    print(f"[*] Mutated {total_names} names from {len(paths)} files.")
+
+
+def print_stats(company, out_dir):
+    """Prints a summary of an earlier run, from its metrics and output files."""
+    metrics_path = f'{out_dir}/{company}-metrics.json'
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding='utf-8') as infile:
+            report = json.load(infile)
+
+        print(f"[*] Run started {report['started']}, took {report['wall_seconds']:.2f} seconds")
+        for name, stage in report['stages'].items():
+            print(f"    {name:<14} {stage['count']:7d} x {stage['mean'] * 1000:9.2f} ms"
+                  f"  = {stage['total']:9.2f} s  (p95 {stage['p95'] * 1000:.2f} ms)")
+        for name, call in report['http'].items():
+            print(f"    HTTP {name:<28} {call['count']:7d} calls, p50 {call['p50'] * 1000:.2f} ms,"
+                  f" p95 {call['p95'] * 1000:.2f} ms")
+        for name, value in report['counters'].items():
+            print(f"    {name:<20} {value}")
+        for search in report.get('searches', []):
+            total = '?' if search['total'] is None else search['total']
+            print(f"    search {search['search']:<33} {search['retrieved']:6d} of {total} retrieved")
+    else:
+        print(f"[!] No metrics found at {metrics_path}")
+
+    print(f"[*] Output files in {out_dir}:")
+    for name in sorted(os.listdir(out_dir) if os.path.isdir(out_dir) else []):
+        if name.startswith(f'{company}-') and name.endswith('.txt'):
+            with open(os.path.join(out_dir, name), 'rb') as infile:
+                lines = sum(chunk.count(b'\n') for chunk in iter(lambda: infile.read(1 << 20), b''))
+            print(f"    {name:<40} {lines:9d} lines")
+        elif name.startswith(f'{company}-') and name.endswith(('.txt.gz', '.txt.zst')):
+            size = os.path.getsize(os.path.join(out_dir, name))
+            print(f"    {name:<40} {size:9d} bytes")
+
+
+def query_store(args):
+    """
+    Prints the usernames, or names and occupations, of employees in the store
+    whose occupation matches the query terms.
+
+    Like stats, nothing is written to the output directory, so the results
+    can be piped straight into other tools.
+    """
+    with EmployeeStore(args.db) as store:
+        company_id = store.find_company(args.company)
+        if company_id is None:
+            print(f"[!] {args.db} has nothing for '{args.company}'.")
+            sys.exit(1)
+        employees = store.query(company_id, args.terms)
+
+    # Only the matches are mutated, so any format can be asked for.
+    split_employees(employees)
+    if args.names:
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerows((employee.full_name, employee.occupation) for employee in employees)
+    else:
+        for employee in employees:
+            for template in args.formats.values():
+                for username in template(employee.first, employee.last, employee.middles,
+                                         employee.surnames):
+                    print(username + args.domain)
+    print(f"[*] {len(employees)} employees matched.", file=sys.stderr)
+
+
+def run(args, metrics):
+    """Does the actual work of main(), timing each stage."""
+    # Saved responses and name lists don't need a session or any of the search set up.
+    if args.command == 'ingest':
+        with metrics.stage('ingest'):
+            ingest_saved_pages(args.path, args.company, args.domain, args.output, args.workers,
+                               args.formats, args.sink, args.records)
+        return
+
+    if args.command == 'mutate':
+        with metrics.stage('mutate'):
+            mutate_name_files(args.names, args.company, args.domain, args.output, args.formats,
+                              sink=args.sink, workers=args.workers, records=args.records)
+        return
+
+    if args.command == 'export':
+        with metrics.stage('export'), EmployeeStore(args.db) as store:
+            company_id = store.find_company(args.company)
+            if company_id is None:
+                print(f"[!] {args.db} has nothing for '{args.company}'.")
+                sys.exit(1)
+            total_names = store.export(company_id, args.prefix, args.domain, args.output,
+                                       args.formats, args.since, args.sink, args.records)
+        print(f"[*] Exported {total_names} names from {args.db}")
+        return
+
+    # Raw responses are kept on disk when caching, and are all we use when replaying.
+    cache = None
+    if args.cache or args.replay:
+        cache = ResponseCache(args.cache_dir,
+                              ttl=None if args.replay else args.cache_ttl * 3600,
+                              max_bytes=args.cache_size * 1024 * 1024)
+
+    if args.replay:
+        print(f"[*] Replaying cached responses from {args.cache_dir}, not logging in.")
+        session = None
+    else:
+        # Instantiate a session by login in to LinkedIn
+        with metrics.stage('login'):
+            session = login(args, metrics)
+        # If we can't get a valid session, we quit now. Specific errors are
+        # printed to the console inside the login() function.
+        if not session:
+            print("Good byy :(")
+            sys.exit(1)  # Good byy :(
+
+        print("[*] Successfully logged in.")
 
     # Get basic company info
     print("[*] Trying to get company info...")
-    company_id, staff_count = get_company_info(args.company, session)
+    with metrics.stage('company_info'):
+        company_id, staff_count = get_company_info(args.company, session, cache)
 
     # Define inner and outer loops
     print("[*] Calculating inner and outer loops...")
     args.depth, args.geoblast = set_inner_loops(staff_count, args)
     outer_loops = set_outer_loops(args)
 
+    # Every completed page is checkpointed, so an interrupted search can be resumed.
+    search = {'company': args.company, 'geoblast': args.geoblast, 'keywords': args.keywords}
+    journal = CrawlJournal(f'{args.output}/{args.company}-journal.jsonl', search)
+    if args.resume and not journal.resume():
+        print("[*] No checkpoint for this search in the output directory, starting over.")
+
     # Do the actual searching
     print("[*] Starting search.... Press Ctrl-C to break and write files early.\n")
-    employees = do_loops(session, company_id, outer_loops, args)
+    with journal:
+        if args.db:
+            # Employees go into the store as they are found, and the files are
+            # exported from it afterwards, so people it already has are not
+            # mutated again.
+            with EmployeeStore(args.db) as store:
+                run_id = store.start_run(company_id, args.company, args.formats)
+                print(f"[*] Saving to {args.db} as run {run_id}")
+                with metrics.stage('search'):
+                    do_loops(session, company_id, outer_loops, args, store, cache, journal,
+                             metrics)
+                store.flush()
+                print(f"\n[*] {store.new_employees} of these names are new to the store.")
+
+                with metrics.stage('write_files'):
+                    store.export(company_id, args.company, args.domain, args.output,
+                                 args.formats, sink=args.sink, records=args.records)
+        elif args.stream:
+            # The files are written while searching.
+            with OutputWriter(args.company, args.domain, args.output, args.formats,
+                              sink=args.sink, records=args.records) as writer, \
+                    metrics.stage('search'):
+                do_loops(session, company_id, outer_loops, args, writer, cache, journal, metrics)
+        else:
+            with metrics.stage('search'):
+                employees = do_loops(session, company_id, outer_loops, args, cache=cache,
+                                     journal=journal, metrics=metrics)
+
+            # Write the data to some files.
+            with metrics.stage('write_files'):
+                write_files(args.company, args.domain, employees, args.output, args.formats,
+                            args.sink, args.records)
 
-    # Write the data to some files.
-    write_files(args.company, args.domain, employees, args.output)
+
+def main(argv=None):
+    """Main Function"""
+    args = parse_arguments(argv)
+
+    if args.command == 'stats':
+        print_stats(args.company, args.output)
+        return
+    if args.command == 'query':
+        query_store(args)
+        return
+
+    # Timings for every stage are saved next to the output files.
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    metrics = RunMetrics(args.output if args.profile else None, prefix=f'{args.company}-')
+
+    # With --sink jsonl, stdout is for the records, so everything else goes to
+    # stderr. The records still go to whatever stdout is now.
+    args.records = sys.stdout
+    if args.sink == 'jsonl':
+        with contextlib.redirect_stdout(sys.stderr):
+            run_and_report(args, metrics)
+    else:
+        run_and_report(args, metrics)
+
+
+def run_and_report(args, metrics):
+    """Runs the command, finalizes the files, and saves the metrics."""
+    try:
+        run(args, metrics)
+        if args.dedup or args.sort:
+            with metrics.stage('finalize'):
+                finalize_files(args.prefix, args.output, args.formats, args.sort,
+                               args.max_memory, args.sink)
+    finally:
+        metrics.write(f'{args.output}/{args.company}-metrics.json')
 
     # Time to get hacking.
     print(f"\n\n[*] All done! Check out your lovely new files in {args.output}")